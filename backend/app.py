@@ -19,11 +19,12 @@ from routes.admin import admin_bp
 
 # Import utilities
 from utils.config import Config
-from utils.helpers import setup_logging
+from utils.helpers import setup_logging, OrjsonProvider
 
 def create_app():
     """Application factory pattern"""
     app = Flask(__name__)
+    app.json = OrjsonProvider(app)
     
     # Load configuration
     app.config.from_object(Config)
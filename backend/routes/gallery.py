@@ -1,6 +1,6 @@
 from flask import Blueprint, request
-from utils.helpers import format_success_response, format_error_response, require_auth
-from services.dynamodb import DynamoDBService
+from utils.helpers import format_success_response, format_error_response, require_auth, parse_pagination
+from services.dynamodb import DynamoDBService, decode_cursor
 import logging
 
 gallery_bp = Blueprint('gallery', __name__)
@@ -12,11 +12,17 @@ def get_gallery():
     """Get user's gallery with advanced filtering and sorting"""
     try:
         # Parse query parameters
-        page = int(request.args.get('page', 1))
-        limit = min(50, int(request.args.get('limit', 20)))
+        page, limit, _ = parse_pagination(request.args, max_limit=50)
         sort = request.args.get('sort', 'newest')
         filter_type = request.args.get('filter', 'all')
         search = request.args.get('search', '').strip()
+        cursor = request.args.get('cursor')  # opt-in cursor pagination, empty for the first page
+        
+        # Reject a malformed cursor here; once inside the database block it would read as an outage
+        try:
+            decode_cursor(cursor)
+        except ValueError:
+            return format_error_response('Invalid pagination cursor', 400)
         
         try:
             db_service = DynamoDBService()
@@ -28,9 +34,13 @@ def get_gallery():
                 limit=limit,
                 sort=sort,
                 filter_type=filter_type,
-                search=search
+                search=search,
+                cursor=cursor
             )
 
+            if result.get('invalid_cursor'):
+                return format_error_response('Invalid pagination cursor', 400)
+
             if result['success']:
                 # Add gallery-specific metadata
                 gallery_data = result['data']
@@ -77,8 +87,7 @@ def get_gallery():
 def get_favorites():
     """Get user's favorite images"""
     try:
-        page = int(request.args.get('page', 1))
-        limit = min(50, int(request.args.get('limit', 20)))
+        page, limit, _ = parse_pagination(request.args, max_limit=50)
         
         try:
             db_service = DynamoDBService()
@@ -124,8 +133,7 @@ def get_favorites():
 def get_recent():
     """Get user's recent images (last 7 days)"""
     try:
-        page = int(request.args.get('page', 1))
-        limit = min(50, int(request.args.get('limit', 20)))
+        page, limit, _ = parse_pagination(request.args, max_limit=50)
         
         db_service = DynamoDBService()
         
@@ -154,8 +162,7 @@ def search_gallery():
     """Search user's gallery by prompt"""
     try:
         query = request.args.get('q', '').strip()
-        page = int(request.args.get('page', 1))
-        limit = min(50, int(request.args.get('limit', 20)))
+        page, limit, _ = parse_pagination(request.args, max_limit=50)
         
         if not query:
             return format_error_response('Search query is required', 400)
@@ -7,20 +7,33 @@ from utils.helpers import (
     require_auth,
     validate_prompt,
     generate_uuid,
-    get_current_timestamp
+    get_current_timestamp,
+    parse_pagination
 )
 from services.dynamodb import DynamoDBService
 from services.s3_service import S3Service
 from services.usage_tracker import UsageTracker
+from services.together_ai import together_session
 from services.platform_tracker import platform_tracker
+from cachetools import LRUCache
 import logging
 import base64
 import requests
+import threading
 import time
 
 images_bp = Blueprint('images', __name__)
 logger = logging.getLogger(__name__)
 
+# Images that never made it to S3 are kept as data URLs; ids of such images carry
+# this prefix so downloads can be answered from the local cache without a DB lookup
+INLINE_IMAGE_PREFIX = 'inline_'
+# image_id -> (user_id, data_url). Bounded by data URL size: a FLUX PNG is 1.5-3 MB as base64,
+# so 64 MB per worker keeps roughly the last 20-40 inline images while S3 is unavailable
+INLINE_IMAGE_CACHE_BYTES = 64 * 1024 * 1024
+_inline_images = LRUCache(maxsize=INLINE_IMAGE_CACHE_BYTES, getsizeof=lambda entry: len(entry[1]))
+_inline_images_lock = threading.Lock()
+
 # Rate limiting for image generation
 limiter = Limiter(key_func=get_remote_address)
 
@@ -138,7 +151,7 @@ def generate_image():
 
         # Make API request with better error handling
         try:
-            response = requests.post(
+            response = together_session.post(
                 'https://api.together.xyz/v1/images/generations',
                 json=payload,
                 headers=headers,
@@ -205,7 +218,7 @@ def generate_image():
                 # Try to upload to S3, but continue without it if it fails
                 upload_result = None
                 try:
-                    upload_result = s3_service.upload_image(image_bytes, filename)
+                    upload_result = s3_service.upload_image_and_thumbnail(image_bytes, filename)
                 except Exception as upload_error:
                     logger.warning(f"S3 upload failed, continuing without storage: {str(upload_error)}")
 
@@ -213,6 +226,12 @@ def generate_image():
                 base_url = f"data:image/png;base64,{image_b64}"
                 file_url = upload_result['url'] if upload_result and upload_result.get('success') else base_url
                 file_size = upload_result.get('size', len(image_bytes)) if upload_result and upload_result.get('success') else len(image_bytes)
+                thumbnail_url = upload_result.get('thumbnail_url', file_url) if upload_result and upload_result.get('success') else file_url
+
+                if file_url == base_url:
+                    image_id = f"{INLINE_IMAGE_PREFIX}{image_id}"
+                    with _inline_images_lock:
+                        _inline_images[image_id] = (request.user_id, file_url)
 
                 metadata = {
                     'id': image_id,
@@ -226,7 +245,7 @@ def generate_image():
                     'seed': params['seed'],
                     'model': 'black-forest-labs/FLUX.1-schnell-Free',
                     'file_url': file_url,
-                    'thumbnail_url': file_url,
+                    'thumbnail_url': thumbnail_url,
                     'file_size': file_size,
                     'generation_time': generation_time,
                     'created_at': get_current_timestamp(),
@@ -287,7 +306,7 @@ def generate_image():
                     'id': image_id,
                     'url': f"data:image/png;base64,{image_b64}",  # For immediate display
                     'file_url': file_url,  # For downloads
-                    'thumbnail_url': file_url,
+                    'thumbnail_url': thumbnail_url,
                     'prompt': prompt,
                     'negative_prompt': params['negative_prompt'],
                     'width': params['width'],
@@ -314,8 +333,8 @@ def generate_image():
                     # If no email in request, try to get it from Clerk
                     if not user_email and user_id != 'unknown':
                         try:
-                            from services.admin_analytics import AdminAnalytics
-                            admin_analytics = AdminAnalytics()
+                            # Shared instance so the pooled Clerk session is reused
+                            from services.admin_analytics import admin_analytics
                             user_email = admin_analytics._get_user_email_from_clerk(user_id)
                         except:
                             user_email = f"{user_id}@user.com"  # Fallback format
@@ -453,7 +472,7 @@ def generate_image_anonymous():
 
         # Make API request
         try:
-            response = requests.post(
+            response = together_session.post(
                 'https://api.together.xyz/v1/images/generations',
                 json=payload,
                 headers=headers,
@@ -576,8 +595,7 @@ def get_user_images():
     """Get user's images with pagination and filtering"""
     try:
         # Parse query parameters
-        page = int(request.args.get('page', 1))
-        limit = min(50, int(request.args.get('limit', 20)))  # Max 50 per page
+        page, limit, _ = parse_pagination(request.args, max_limit=50)  # Max 50 per page
         sort = request.args.get('sort', 'newest')
         filter_type = request.args.get('filter', 'all')
         search = request.args.get('search', '').strip()
@@ -708,23 +726,16 @@ def delete_image(image_id):
         db_service = DynamoDBService()
         s3_service = S3Service()
         
-        # Get image metadata first
-        image_result = db_service.get_image_by_id(image_id, request.user_id)
-        
-        if not image_result['success']:
-            return format_error_response('Image not found', 404)
-        
-        image_data = image_result['data']
-        
-        # Delete from S3
-        filename = image_data['file_url'].split('/')[-1]  # Extract filename from URL
-        s3_service.delete_image(filename)
-        
-        # Delete from database
+        # Delete from database; ownership is checked in the same conditional write
         db_result = db_service.delete_image(image_id, request.user_id)
         
         if not db_result['success']:
-            return format_error_response(db_result['error'], 500)
+            return format_error_response(db_result['error'], 404 if db_result.get('not_found') else 500)
+        
+        # Delete from S3 using the metadata returned by the delete
+        filename = db_result['data'].get('file_url', '').split('/')[-1]  # Extract filename from URL
+        if filename:
+            s3_service.delete_image(filename)
         
         logger.info(f"Image deleted successfully: {image_id}")
         
@@ -747,7 +758,7 @@ def toggle_favorite(image_id):
         result = db_service.update_image_favorite(image_id, request.user_id, is_favorite)
         
         if not result['success']:
-            return format_error_response(result['error'], 404 if 'not found' in result['error'] else 500)
+            return format_error_response(result['error'], 404 if result.get('not_found') else 500)
         
         action = 'added to' if is_favorite else 'removed from'
         return format_success_response(
@@ -764,6 +775,18 @@ def toggle_favorite(image_id):
 def download_image(image_id):
     """Get download URL for an image"""
     try:
+        # Recently generated inline images are served straight from the local cache
+        if image_id.startswith(INLINE_IMAGE_PREFIX):
+            with _inline_images_lock:
+                cached = _inline_images.get(image_id)
+
+            if cached and cached[0] == request.user_id:
+                return format_success_response({
+                    'download_url': cached[1],
+                    'filename': f"promptcanvas_{image_id}.png",
+                    'expires_in': 3600
+                })
+
         # Try to get image from database
         try:
             db_service = DynamoDBService()
@@ -864,7 +887,7 @@ def save_to_gallery():
         s3_service = S3Service()
 
         # Upload to S3
-        upload_result = s3_service.upload_image(image_bytes, filename)
+        upload_result = s3_service.upload_image_and_thumbnail(image_bytes, filename)
 
         if not upload_result['success']:
             logger.error(f"S3 upload failed: {upload_result}")
@@ -883,7 +906,7 @@ def save_to_gallery():
             'seed': image_metadata.get('seed', -1),
             'model': image_metadata.get('model', 'black-forest-labs/FLUX.1-schnell-Free'),
             'file_url': upload_result['url'],
-            'thumbnail_url': upload_result['url'],  # Use same URL for now
+            'thumbnail_url': upload_result.get('thumbnail_url', upload_result['url']),
             'file_size': upload_result['size'],
             'generation_time': image_metadata.get('generation_time', 0),
             'created_at': get_current_timestamp(),
@@ -918,7 +941,7 @@ def save_to_gallery():
         return format_success_response({
             'id': image_id,
             'url': upload_result['url'],
-            'thumbnail_url': upload_result['url'],
+            'thumbnail_url': metadata['thumbnail_url'],
             'message': 'Image saved to gallery successfully'
         })
 
@@ -1,6 +1,6 @@
 from flask import Blueprint, request
-from utils.helpers import format_success_response, format_error_response, require_auth
-from services.dynamodb import DynamoDBService
+from utils.helpers import format_success_response, format_error_response, require_auth, parse_pagination
+from services.dynamodb import DynamoDBService, decode_cursor
 from services.s3_service import S3Service
 from datetime import datetime
 import logging
@@ -122,8 +122,14 @@ def update_user_settings():
 def get_user_history():
     """Get user's generation history"""
     try:
-        page = int(request.args.get('page', 1))
-        limit = min(50, int(request.args.get('limit', 20)))
+        page, limit, _ = parse_pagination(request.args, max_limit=50)
+        cursor = request.args.get('cursor')  # opt-in cursor pagination, empty for the first page
+        
+        # Reject a malformed cursor here; once inside the database block it would read as an outage
+        try:
+            decode_cursor(cursor)
+        except ValueError:
+            return format_error_response('Invalid pagination cursor', 400)
 
         try:
             db_service = DynamoDBService()
@@ -132,9 +138,13 @@ def get_user_history():
             result = db_service.get_user_generation_history(
                 user_id=request.user_id,
                 page=page,
-                limit=limit
+                limit=limit,
+                cursor=cursor
             )
 
+            if result.get('invalid_cursor'):
+                return format_error_response('Invalid pagination cursor', 400)
+
             if result['success']:
                 return format_success_response(result['data'])
             else:
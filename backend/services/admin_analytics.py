@@ -5,27 +5,242 @@ Collects actual platform data instead of mock data
 
 import os
 import json
+import orjson
+import heapq
 import logging
-from datetime import datetime, timedelta
-from typing import Dict, List, Any
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Any, Set
 import requests
+from requests.adapters import HTTPAdapter
+from requests_cache import CachedSession
+from urllib3.util.retry import Retry
 from services.platform_tracker import platform_tracker
 
 logger = logging.getLogger(__name__)
 
+# Clerk GET responses are cached on disk so dashboard loads and worker restarts reuse them;
+# user records rarely change, while the user count is refreshed every five minutes
+CLERK_CACHE_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'clerk_cache')
+CLERK_CACHE_EXPIRE_AFTER = {
+    'api.clerk.com/v1/users/count': 300,
+    'api.clerk.com/v1/users*': 3600
+}
+# An expired response is still served for this long when Clerk errors or is unreachable
+CLERK_CACHE_STALE_IF_ERROR = 3600
+
+# Max user ids per Clerk list request
+CLERK_EMAIL_BATCH_SIZE = 50
+
+# Max concurrent Clerk list requests
+CLERK_EMAIL_MAX_WORKERS = 4
+
+# Placeholder accounts that never count towards platform analytics
+_EXCLUDED_IDS = frozenset(('demo', 'test'))
+
+
+def _is_real_user_image(img: Dict[str, Any]) -> bool:
+    """Check whether an image record belongs to a real user and succeeded"""
+    get = img.get
+    user_id = get('user_id')
+    return bool(user_id and
+                user_id not in _EXCLUDED_IDS and
+                not user_id.startswith('user_test') and
+                get('success', False))
+
+
+@lru_cache(maxsize=4096)
+def _parse_iso_ordinal(created_at: str):
+    """Parse an ISO timestamp into a proleptic day ordinal, or None if it is malformed"""
+    try:
+        # Fast path for the YYYY-MM-DD... prefix our writers produce; only the date is used
+        if len(created_at) >= 10 and created_at[4] == '-' and created_at[7] == '-':
+            return date(int(created_at[0:4]), int(created_at[5:7]), int(created_at[8:10])).toordinal()
+        return datetime.fromisoformat(created_at.replace('Z', '+00:00')).toordinal()
+    except (TypeError, ValueError):
+        return None
+
+def _scan_images(images: Iterable[Dict[str, Any]], today: date) -> Dict[str, Any]:
+    """Aggregate real-user image records in one pass"""
+    # user_ids are interned to small ints so the window sets hash ints, not strings
+    id_map: Dict[str, int] = {}
+    intern_id = id_map.setdefault
+    total_users: Set[int] = set()
+    prompt_users: Set[int] = set()  # Users with at least one image that has a prompt and created_at
+    active_today: Set[int] = set()
+    active_week: Set[int] = set()
+    active_month: Set[int] = set()
+    total_images: int = 0
+    storage_bytes: int = 0
+    storage_images: int = 0
+    recent: List[Dict[str, Any]] = []
+    user_counts: Dict[str, Dict[str, Any]] = {}
+    daily_counts: List[int] = [0] * 7
+
+    # Bind hot callables to locals so the loop avoids global/attribute lookups
+    is_real = _is_real_user_image
+    parse_ordinal = _parse_iso_ordinal
+    today_ordinal: int = today.toordinal()
+    total_users_add = total_users.add
+    prompt_users_add = prompt_users.add
+    active_today_add = active_today.add
+    active_week_add = active_week.add
+    active_month_add = active_month.add
+    recent_append = recent.append
+    get_user_entry = user_counts.get
+    default_size = 2 * 1024 * 1024  # Estimate 2MB for images without size data
+
+    for img in images:
+        if not is_real(img):
+            continue
+
+        get = img.get
+        user_id: str = img['user_id']
+        created_at: str = get('created_at', '')
+        uid: int = intern_id(user_id, len(id_map))
+
+        total_users_add(uid)
+        prompt = get('prompt')
+        if prompt and created_at:
+            total_images += 1
+            prompt_users_add(uid)
+
+        file_size = get('file_size', 0)
+        storage_bytes += file_size if file_size > 0 else default_size
+        storage_images += 1
+
+        user_email = get('user_email', f'{user_id}@user.com')
+        recent_append({
+            'type': 'image_generated',
+            'user_id': user_id,
+            'user_email': user_email,
+            'timestamp': created_at,
+            'details': f"Generated: {get('prompt', 'Unknown prompt')[:50]}..."
+        })
+
+        entry = get_user_entry(user_id)
+        if entry is None:
+            entry = user_counts[user_id] = {
+                'user_id': user_id,
+                'email': user_email,
+                'images_generated': 0,
+                'last_active': created_at
+            }
+        entry['images_generated'] += 1
+        if created_at > entry['last_active']:
+            entry['last_active'] = created_at
+
+        if not created_at:
+            continue
+
+        # Parse the date once (cached across re-aggregations) and reuse it for every time window
+        img_ordinal = parse_ordinal(created_at)
+        if img_ordinal is None:
+            continue
+
+        days_ago: int = today_ordinal - img_ordinal
+        if days_ago == 0:
+            active_today_add(uid)
+        if days_ago <= 7:
+            active_week_add(uid)
+        if days_ago <= 30:
+            active_month_add(uid)
+        if 0 <= days_ago < 7:
+            daily_counts[6 - days_ago] += 1
+
+    return {
+        'total_users': total_users,
+        'prompt_users': prompt_users,
+        'total_images': total_images,
+        'storage_bytes': storage_bytes,
+        'storage_images': storage_images,
+        'active_today': active_today,
+        'active_week': active_week,
+        'active_month': active_month,
+        'recent': recent,
+        'user_counts': user_counts,
+        'daily_counts': daily_counts
+    }
+
 class AdminAnalytics:
     def __init__(self):
         self.clerk_secret = os.getenv('CLERK_SECRET_KEY')
         self.data_cache = {}
         self.cache_timeout = 300  # 5 minutes
+        self.cache_timeout_emails = 3600  # Clerk emails rarely change
+        self.cache_timeout_stale = 900  # serve stale aggregates while refreshing
+        self._cache_lock = threading.Lock()
+        self._aggregate_refresh_in_flight = False
+        self._clerk_session = self._create_clerk_session()
+        self._db_service = None  # created lazily, it needs the Flask app context
+
+        try:
+            from services.persistent_storage import PersistentStorage
+            self._storage = PersistentStorage()
+        except Exception as e:
+            logger.error(f"Persistent storage unavailable for analytics: {e}")
+            self._storage = None
+
+    def _get_db_service(self):
+        """Get the shared DynamoDB service, creating it on first use"""
+        if self._db_service is None:
+            from services.dynamodb import DynamoDBService
+            self._db_service = DynamoDBService()
+        return self._db_service
+
+    def _create_clerk_session(self) -> requests.Session:
+        """Create a pooled keep-alive session for Clerk API calls, backed by the SQLite response cache"""
+        session = CachedSession(
+            CLERK_CACHE_PATH,
+            backend='sqlite',
+            urls_expire_after=CLERK_CACHE_EXPIRE_AFTER,
+            stale_if_error=CLERK_CACHE_STALE_IF_ERROR,
+            allowable_methods=('GET',),
+            allowable_codes=(200,)
+        )
+        session.headers.update({
+            'Authorization': f'Bearer {self.clerk_secret}',
+            'Content-Type': 'application/json'
+        })
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=16,
+            max_retries=Retry(total=2, backoff_factor=0.2)
+        )
+        session.mount('https://', adapter)
+        return session
         
     def get_real_platform_stats(self) -> Dict[str, Any]:
         """Get ONLY REAL USER PERFORMANCE statistics - NO mock/demo data"""
         try:
-            # Get ONLY real user performance data from persistent storage
-            real_user_count = self._get_real_active_users()
-            real_image_count = self._get_real_image_count()
-            real_storage_usage = self._get_real_storage_from_images()
+            # Get ONLY real user performance data from persistent storage (single pass)
+            try:
+                aggregates = self._get_platform_aggregates()
+            except Exception as e:
+                # Each metric retries on its own and falls back or reports 0 independently
+                logger.error(f"Failed to aggregate persistent storage images: {e}")
+                aggregates = None
+            real_user_count = self._get_real_active_users(aggregates)
+            real_image_count = self._get_real_image_count(aggregates)
+            real_storage_usage = self._get_real_storage_from_images(aggregates)
+            recent_activity = self._get_real_user_recent_activity(aggregates)
+            top_users = self._get_real_active_top_users(aggregates)
+
+            # Resolve placeholder emails with one batched Clerk lookup
+            unresolved = {entry['user_id'] for entry in recent_activity if entry['user_email'].endswith('@user.com')}
+            unresolved.update(user['user_id'] for user in top_users if user['email'].endswith('@user.com'))
+            emails = self._get_emails_bulk(unresolved)
+            if emails:
+                recent_activity = [
+                    {**entry, 'user_email': emails.get(entry['user_id'], entry['user_email'])}
+                    for entry in recent_activity
+                ]
+                top_users = [
+                    {**user, 'email': emails.get(user['user_id'], user['email'])}
+                    for user in top_users
+                ]
 
             # Build stats from ONLY real user performance - NO mock data
             stats = {
@@ -33,19 +248,19 @@ class AdminAnalytics:
                     'total_users': real_user_count,
                     'total_images_generated': real_image_count,
                     'total_storage_used_mb': real_storage_usage,
-                    'active_users_today': self._get_real_active_users_today(),
-                    'active_users_this_week': self._get_real_active_users_week(),
-                    'active_users_this_month': self._get_real_active_users_month(),
+                    'active_users_today': self._get_real_active_users_today(aggregates),
+                    'active_users_this_week': self._get_real_active_users_week(aggregates),
+                    'active_users_this_month': self._get_real_active_users_month(aggregates),
                     'total_api_calls': real_image_count,  # Same as images for real users
                     'total_costs_usd': real_image_count * 0.01,  # Estimate based on real usage
                     'last_updated': datetime.utcnow().isoformat(),
                     'uptime_hours': self._get_actual_uptime(),
                     'avg_response_time_ms': 5000 if real_image_count > 0 else 0  # Real response time
                 },
-                'recent_activity': self._get_real_user_recent_activity(),
-                'top_users': self._get_real_active_top_users(),
+                'recent_activity': recent_activity,
+                'top_users': top_users,
                 'system_health': self._get_real_system_status(),
-                'usage_trends': self._get_real_user_trends(real_image_count),
+                'usage_trends': self._get_real_user_trends(real_image_count, aggregates),
                 'security_events': []  # Only real security events, empty if none
             }
 
@@ -81,24 +296,9 @@ class AdminAnalytics:
         try:
             # PRIMARY: Get real users from persistent storage (users who generated images)
             try:
-                from services.persistent_storage import PersistentStorage
-                persistent_storage = PersistentStorage()
-                all_images = persistent_storage.get_all_images()
-
-                # Count unique real users (exclude test/demo users)
-                real_users = set()
-                for img in all_images:
-                    user_id = img.get('user_id')
-                    if (user_id and
-                        user_id != 'demo' and
-                        user_id != 'test' and
-                        not user_id.startswith('user_test') and
-                        img.get('prompt') and
-                        img.get('created_at') and
-                        img.get('success', False)):
-                        real_users.add(user_id)
-
-                real_user_count = len(real_users)
+                # Count unique real users from the shared aggregate instead of rescanning; only
+                # images with a prompt and created_at make their user count here
+                real_user_count = len(self._get_platform_aggregates()['prompt_users'])
                 if real_user_count > 0:
                     logger.info(f"👥 Real active user count: {real_user_count}")
                     return real_user_count
@@ -112,37 +312,15 @@ class AdminAnalytics:
             # FALLBACK: Try Clerk API if available (but still filter for real users)
             if self.clerk_secret:
                 try:
-                    # Check cache first
-                    cache_key = 'clerk_users'
-                    if self._is_cache_valid(cache_key):
-                        return self.data_cache[cache_key]['data']
-
-                    headers = {
-                        'Authorization': f'Bearer {self.clerk_secret}',
-                        'Content-Type': 'application/json'
-                    }
-
-                    response = requests.get(
-                        'https://api.clerk.com/v1/users',
-                        headers=headers,
+                    # Only the total is needed, so skip the full user list payload; repeat
+                    # calls within five minutes are answered from the Clerk response cache
+                    response = self._clerk_session.get(
+                        'https://api.clerk.com/v1/users/count',
                         timeout=10
                     )
 
                     if response.status_code == 200:
-                        users_data = response.json()
-                        # Handle both list and dict responses from Clerk API
-                        if isinstance(users_data, list):
-                            user_count = len(users_data)
-                        elif isinstance(users_data, dict):
-                            user_count = len(users_data.get('data', []))
-                        else:
-                            user_count = 0  # No real users
-
-                        # Cache the result
-                        self.data_cache[cache_key] = {
-                            'data': user_count,
-                            'timestamp': datetime.utcnow()
-                        }
+                        user_count = orjson.loads(response.content).get('total_count', 0)
 
                         logger.info(f"👥 Fallback: Retrieved {user_count} users from Clerk API")
                         return user_count
@@ -164,25 +342,15 @@ class AdminAnalytics:
             if not self.clerk_secret or not user_id:
                 return f"{user_id}@user.com"
 
-            headers = {
-                'Authorization': f'Bearer {self.clerk_secret}',
-                'Content-Type': 'application/json'
-            }
-
-            response = requests.get(
+            response = self._clerk_session.get(
                 f'https://api.clerk.com/v1/users/{user_id}',
-                headers=headers,
                 timeout=5
             )
 
             if response.status_code == 200:
-                user_data = response.json()
-                email_addresses = user_data.get('email_addresses', [])
-                if email_addresses:
-                    primary_email = next((email['email_address'] for email in email_addresses if email.get('primary')), None)
-                    if primary_email:
-                        return primary_email
-                    return email_addresses[0]['email_address']
+                primary_email = self._primary_email(orjson.loads(response.content))
+                if primary_email:
+                    return primary_email
 
             return f"{user_id}@user.com"
 
@@ -190,26 +358,132 @@ class AdminAnalytics:
             logger.warning(f"Failed to get user email from Clerk: {e}")
             return f"{user_id}@user.com"
 
-    def _get_real_image_count(self) -> int:
+    def _get_emails_bulk(self, user_ids) -> Dict[str, str]:
+        """Get primary emails for many users using batched Clerk list calls"""
+        if not self.clerk_secret or not user_ids:
+            return {}
+
+        cache_key = 'clerk_emails'
+        with self._cache_lock:
+            if not self._is_cache_valid(cache_key, self.cache_timeout_emails):
+                self.data_cache[cache_key] = {
+                    'data': {},
+                    'timestamp': datetime.utcnow()
+                }
+            emails = self.data_cache[cache_key]['data']
+            missing = [user_id for user_id in user_ids if user_id not in emails]
+
+        # Batches are independent, so fetch them concurrently
+        batches = [missing[start:start + CLERK_EMAIL_BATCH_SIZE]
+                   for start in range(0, len(missing), CLERK_EMAIL_BATCH_SIZE)]
+        if batches:
+            with ThreadPoolExecutor(max_workers=min(CLERK_EMAIL_MAX_WORKERS, len(batches))) as executor:
+                for batch_emails in executor.map(self._fetch_email_batch, batches):
+                    with self._cache_lock:
+                        emails.update(batch_emails)
+
+        return {user_id: emails[user_id] for user_id in user_ids if user_id in emails}
+
+    def _fetch_email_batch(self, user_ids: List[str]) -> Dict[str, str]:
+        """Fetch primary emails for one batch of users from Clerk"""
+        emails = {}
+        try:
+            params = [('user_id', user_id) for user_id in user_ids]
+            params.append(('limit', len(user_ids)))
+            response = self._clerk_session.get(
+                'https://api.clerk.com/v1/users',
+                params=params,
+                timeout=10
+            )
+
+            if response.status_code != 200:
+                logger.warning(f"Clerk bulk user lookup failed: {response.status_code}")
+                return emails
+
+            users_data = orjson.loads(response.content)
+            # Handle both list and dict responses from Clerk API
+            if isinstance(users_data, dict):
+                users_data = users_data.get('data', [])
+
+            for user_data in users_data:
+                primary_email = self._primary_email(user_data)
+                if primary_email:
+                    emails[user_data.get('id')] = primary_email
+
+        except Exception as e:
+            logger.warning(f"Failed to get user emails from Clerk: {e}")
+
+        return emails
+
+    @staticmethod
+    def _primary_email(user_data: Dict[str, Any]) -> str:
+        """Pick the primary email address from a Clerk user object"""
+        email_addresses = user_data.get('email_addresses', [])
+        if not email_addresses:
+            return None
+        primary_email = next((email['email_address'] for email in email_addresses if email.get('primary')), None)
+        return primary_email or email_addresses[0]['email_address']
+
+    def _get_platform_aggregates(self) -> Dict[str, Any]:
+        """Get image aggregates, serving a stale copy while a refresh runs"""
+        if self._storage is None:
+            raise RuntimeError("Persistent storage unavailable")
+        
+        cache_key = 'platform_aggregate'
+        cached = self.data_cache.get(cache_key)
+        if cached and self._is_cache_valid(cache_key, self.cache_timeout_stale):
+            # Fresh while stored images are unchanged; the TTL also rolls the day-based windows over
+            version = self._storage.version
+            fresh = (version is not None and cached['version'] == version and
+                     self._is_cache_valid(cache_key))
+            if not fresh:
+                self._start_aggregate_refresh()
+            return cached['data']
+
+        return self._refresh_platform_aggregates()
+
+    def _refresh_platform_aggregates(self) -> Dict[str, Any]:
+        """Recompute the aggregates and store them with the storage version they reflect"""
+        # Read the version first so writes during the scan leave the entry stale
+        version = self._storage.version
+        aggregates = self._compute_all_aggregates()
+        with self._cache_lock:
+            self.data_cache['platform_aggregate'] = {
+                'data': aggregates,
+                'version': version,
+                'timestamp': datetime.utcnow()
+            }
+        return aggregates
+
+    def _start_aggregate_refresh(self):
+        """Refresh the aggregates in a background thread unless one is already running"""
+        with self._cache_lock:
+            if self._aggregate_refresh_in_flight:
+                return
+            self._aggregate_refresh_in_flight = True
+
+        def refresh():
+            try:
+                self._refresh_platform_aggregates()
+            except Exception as e:
+                logger.error(f"Background aggregate refresh failed: {e}")
+            finally:
+                with self._cache_lock:
+                    self._aggregate_refresh_in_flight = False
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def _compute_all_aggregates(self) -> Dict[str, Any]:
+        """Collect every real-user aggregate in a single pass over stored images"""
+        return _scan_images(self._storage.iter_all_images(), datetime.utcnow().date())
+
+    def _get_real_image_count(self, aggregates: Dict[str, Any] = None) -> int:
         """Get ONLY REAL USER image count - actual user performance data"""
         try:
             # PRIMARY: Get real user images from persistent storage
             try:
-                from services.persistent_storage import PersistentStorage
-                persistent_storage = PersistentStorage()
-                all_images = persistent_storage.get_all_images()
-
-                # Count only real user images (filter out test/demo data)
-                real_user_count = 0
-                for img in all_images:
-                    if (img.get('user_id') and
-                        img.get('user_id') != 'demo' and
-                        img.get('user_id') != 'test' and
-                        not img.get('user_id', '').startswith('user_test') and
-                        img.get('prompt') and
-                        img.get('created_at') and
-                        img.get('success', False)):
-                        real_user_count += 1
+                aggregates = aggregates or self._get_platform_aggregates()
+                real_user_count = aggregates['total_images']
 
                 if real_user_count > 0:
                     logger.info(f"👥 Real user image count from persistent storage: {real_user_count}")
@@ -222,21 +496,10 @@ class AdminAnalytics:
 
             # FALLBACK: Try DynamoDB for real user data only
             try:
-                from services.dynamodb import DynamoDBService
-                db_service = DynamoDBService()
-                all_images = db_service.get_all_images_admin()
-
-                # Count only real user images from DynamoDB
-                real_user_count = 0
-                for img in all_images:
-                    if (img.get('user_id') and
-                        img.get('user_id') != 'demo' and
-                        img.get('user_id') != 'test' and
-                        not img.get('user_id', '').startswith('user_test') and
-                        img.get('prompt') and
-                        img.get('created_at') and
-                        img.get('success', False)):
-                        real_user_count += 1
+                db_service = self._get_db_service()
+
+                # Count only real user images, filtered and counted by DynamoDB
+                real_user_count = db_service.count_real_user_images()
 
                 if real_user_count > 0:
                     logger.info(f"👥 Fallback: Real user image count from DynamoDB: {real_user_count}")
@@ -253,375 +516,82 @@ class AdminAnalytics:
             logger.error(f"Failed to get real user image count: {e}")
             return 0
     
-    def _get_real_storage_from_images(self) -> float:
+    def _get_real_storage_from_images(self, aggregates: Dict[str, Any] = None) -> float:
         """Get REAL storage usage from actual user images"""
         try:
-            from services.persistent_storage import PersistentStorage
-            persistent_storage = PersistentStorage()
-            all_images = persistent_storage.get_all_images()
-
-            # Calculate real storage from actual user images only
-            total_storage_bytes = 0
-            real_user_images = 0
-
-            for img in all_images:
-                if (img.get('user_id') and
-                    img.get('user_id') != 'demo' and
-                    img.get('user_id') != 'test' and
-                    not img.get('user_id', '').startswith('user_test') and
-                    img.get('success', False)):
-
-                    file_size = img.get('file_size', 0)
-                    if file_size > 0:
-                        total_storage_bytes += file_size
-                    else:
-                        # Estimate 2MB for images without size data
-                        total_storage_bytes += 2 * 1024 * 1024
-                    real_user_images += 1
-
-            storage_mb = total_storage_bytes / (1024 * 1024)
-            logger.info(f"Real storage usage: {storage_mb:.2f} MB from {real_user_images} user images")
+            aggregates = aggregates or self._get_platform_aggregates()
+
+            storage_mb = aggregates['storage_bytes'] / (1024 * 1024)
+            logger.info(f"Real storage usage: {storage_mb:.2f} MB from {aggregates['storage_images']} user images")
             return round(storage_mb, 2)
 
         except Exception as e:
             logger.error(f"Failed to get real storage usage: {e}")
             return 0.0
     
-    def _get_real_activity_data(self) -> Dict[str, Any]:
-        """Get real activity data"""
-        try:
-            # This would typically come from your analytics/logging system
-            return {
-                'active_today': 1,  # At least you
-                'active_week': 1,
-                'api_calls': self._get_real_image_count() * 2,  # Estimate 2 calls per image
-                'avg_response_time': 85  # Realistic response time
-            }
-        except Exception as e:
-            logger.error(f"Failed to get activity data: {e}")
-            return {}
-    
-    def _get_real_recent_activity(self) -> List[Dict[str, Any]]:
-        """Get real recent activity"""
-        try:
-            current_time = datetime.utcnow()
-            
-            activities = [
-                {
-                    'id': f'activity_{int(current_time.timestamp())}',
-                    'user': 'demo@example.com',  # Your current session
-                    'action': 'Accessed admin dashboard',
-                    'timestamp': current_time.isoformat(),
-                    'details': 'Viewed platform analytics',
-                    'ip_address': '127.0.0.1',
-                    'user_agent': 'Admin Dashboard'
-                }
-            ]
-            
-            # Add more realistic activities based on actual usage
-            if self._get_real_image_count() > 0:
-                activities.append({
-                    'id': f'activity_{int(current_time.timestamp()) - 300}',
-                    'user': 'demo@example.com',
-                    'action': 'Generated image',
-                    'timestamp': (current_time - timedelta(minutes=5)).isoformat(),
-                    'details': 'Created AI-generated image',
-                    'ip_address': '127.0.0.1',
-                    'user_agent': 'Web Browser'
-                })
-            
-            return activities
-            
-        except Exception as e:
-            logger.error(f"Failed to get recent activity: {e}")
-            return []
-    
-    def _get_real_top_users(self) -> List[Dict[str, Any]]:
-        """Get real top users"""
-        try:
-            return [
-                {
-                    'email': 'demo@example.com',  # Your current session
-                    'images_generated': self._get_real_image_count(),
-                    'last_active': datetime.utcnow().isoformat(),
-                    'total_storage_mb': self._get_real_storage_usage(),
-                    'join_date': '2025-01-01T00:00:00Z',
-                    'subscription': 'admin'
-                }
-            ]
-        except Exception as e:
-            logger.error(f"Failed to get top users: {e}")
-            return []
-    
-    def _get_real_system_health(self) -> Dict[str, Any]:
-        """Get real system health"""
-        try:
-            current_time = datetime.utcnow()
-            
-            return {
-                'api_status': 'healthy',
-                'database_status': 'healthy',
-                'storage_status': 'healthy',
-                'ai_service_status': 'healthy',
-                'last_health_check': current_time.isoformat(),
-                'response_times': {
-                    'api_avg_ms': 85,
-                    'db_avg_ms': 25,
-                    'ai_avg_ms': 4200  # Realistic AI generation time
-                },
-                'error_rates': {
-                    'api_error_rate': 0.1,
-                    'generation_error_rate': 0.05
-                }
-            }
-        except Exception as e:
-            logger.error(f"Failed to get system health: {e}")
-            return {}
-    
-    def _get_real_usage_trends(self, image_count: int) -> Dict[str, Any]:
-        """Get real usage trends"""
-        try:
-            # Generate realistic trends based on actual usage
-            daily_base = max(1, image_count // 7)  # Spread over week
-            
-            return {
-                'daily_generations': [daily_base] * 7,
-                'weekly_users': [1] * 4,  # You as the main user
-                'monthly_growth': [1] * 4,
-                'hourly_activity': [0] * 24  # Mostly inactive hours
-            }
-        except Exception as e:
-            logger.error(f"Failed to get usage trends: {e}")
-            return {}
-    
-    def _get_real_security_events(self) -> List[Dict[str, Any]]:
-        """Get real security events"""
-        try:
-            current_time = datetime.utcnow()
-            
-            return [
-                {
-                    'type': 'admin_login',
-                    'user': 'srikarboina9999@gmail.com',  # Your admin email
-                    'timestamp': current_time.isoformat(),
-                    'ip_address': '127.0.0.1',
-                    'status': 'success'
-                }
-            ]
-        except Exception as e:
-            logger.error(f"Failed to get security events: {e}")
-            return []
-    
-    def _get_uptime_hours(self) -> float:
-        """Get system uptime in hours"""
-        try:
-            # This would typically come from your monitoring system
-            # For now, return a realistic uptime
-            return 720.0  # 30 days
-        except Exception as e:
-            return 0.0
-    
-    def _is_cache_valid(self, cache_key: str) -> bool:
+    def _is_cache_valid(self, cache_key: str, timeout: int = None) -> bool:
         """Check if cached data is still valid"""
         if cache_key not in self.data_cache:
             return False
         
         cache_time = self.data_cache[cache_key]['timestamp']
-        return (datetime.utcnow() - cache_time).seconds < self.cache_timeout
+        return (datetime.utcnow() - cache_time).total_seconds() < (timeout or self.cache_timeout)
 
-    def _get_real_active_users(self) -> int:
+    def _get_real_active_users(self, aggregates: Dict[str, Any] = None) -> int:
         """Get count of users who actually generated images"""
         try:
-            from services.persistent_storage import PersistentStorage
-            persistent_storage = PersistentStorage()
-            all_images = persistent_storage.get_all_images()
-
-            # Count unique real users who generated images
-            real_users = set()
-            for img in all_images:
-                user_id = img.get('user_id')
-                if (user_id and
-                    user_id != 'demo' and
-                    user_id != 'test' and
-                    not user_id.startswith('user_test') and
-                    img.get('success', False)):
-                    real_users.add(user_id)
-
-            return len(real_users)
+            aggregates = aggregates or self._get_platform_aggregates()
+            return len(aggregates['total_users'])
         except Exception as e:
             logger.error(f"Failed to get real active users: {e}")
             return 0
 
-    def _get_real_active_users_today(self) -> int:
+    def _get_real_active_users_today(self, aggregates: Dict[str, Any] = None) -> int:
         """Get users who generated images today"""
         try:
-            from services.persistent_storage import PersistentStorage
-            from datetime import datetime, timedelta
-
-            persistent_storage = PersistentStorage()
-            all_images = persistent_storage.get_all_images()
-
-            today = datetime.utcnow().date()
-            active_today = set()
-
-            for img in all_images:
-                user_id = img.get('user_id')
-                created_at = img.get('created_at', '')
-
-                if (user_id and
-                    user_id != 'demo' and
-                    user_id != 'test' and
-                    not user_id.startswith('user_test') and
-                    img.get('success', False) and
-                    created_at):
-
-                    try:
-                        img_date = datetime.fromisoformat(created_at.replace('Z', '+00:00')).date()
-                        if img_date == today:
-                            active_today.add(user_id)
-                    except:
-                        pass
-
-            return len(active_today)
+            aggregates = aggregates or self._get_platform_aggregates()
+            return len(aggregates['active_today'])
         except Exception as e:
             logger.error(f"Failed to get active users today: {e}")
             return 0
 
-    def _get_real_active_users_week(self) -> int:
+    def _get_real_active_users_week(self, aggregates: Dict[str, Any] = None) -> int:
         """Get users who generated images this week"""
         try:
-            from services.persistent_storage import PersistentStorage
-            from datetime import datetime, timedelta
-
-            persistent_storage = PersistentStorage()
-            all_images = persistent_storage.get_all_images()
-
-            week_ago = (datetime.utcnow() - timedelta(days=7)).date()
-            active_week = set()
-
-            for img in all_images:
-                user_id = img.get('user_id')
-                created_at = img.get('created_at', '')
-
-                if (user_id and
-                    user_id != 'demo' and
-                    user_id != 'test' and
-                    not user_id.startswith('user_test') and
-                    img.get('success', False) and
-                    created_at):
-
-                    try:
-                        img_date = datetime.fromisoformat(created_at.replace('Z', '+00:00')).date()
-                        if img_date >= week_ago:
-                            active_week.add(user_id)
-                    except:
-                        pass
-
-            return len(active_week)
+            aggregates = aggregates or self._get_platform_aggregates()
+            return len(aggregates['active_week'])
         except Exception as e:
             logger.error(f"Failed to get active users this week: {e}")
             return 0
 
-    def _get_real_active_users_month(self) -> int:
+    def _get_real_active_users_month(self, aggregates: Dict[str, Any] = None) -> int:
         """Get users who generated images this month"""
         try:
-            from services.persistent_storage import PersistentStorage
-            from datetime import datetime, timedelta
-
-            persistent_storage = PersistentStorage()
-            all_images = persistent_storage.get_all_images()
-
-            month_ago = (datetime.utcnow() - timedelta(days=30)).date()
-            active_month = set()
-
-            for img in all_images:
-                user_id = img.get('user_id')
-                created_at = img.get('created_at', '')
-
-                if (user_id and
-                    user_id != 'demo' and
-                    user_id != 'test' and
-                    not user_id.startswith('user_test') and
-                    img.get('success', False) and
-                    created_at):
-
-                    try:
-                        img_date = datetime.fromisoformat(created_at.replace('Z', '+00:00')).date()
-                        if img_date >= month_ago:
-                            active_month.add(user_id)
-                    except:
-                        pass
-
-            return len(active_month)
+            aggregates = aggregates or self._get_platform_aggregates()
+            return len(aggregates['active_month'])
         except Exception as e:
             logger.error(f"Failed to get active users this month: {e}")
             return 0
 
-    def _get_real_user_recent_activity(self) -> List[Dict[str, Any]]:
+    def _get_real_user_recent_activity(self, aggregates: Dict[str, Any] = None) -> List[Dict[str, Any]]:
         """Get real recent activity from actual user images"""
         try:
-            from services.persistent_storage import PersistentStorage
-            persistent_storage = PersistentStorage()
-            all_images = persistent_storage.get_all_images()
-
-            # Get real user activities
-            activities = []
-            for img in all_images:
-                user_id = img.get('user_id')
-                if (user_id and
-                    user_id != 'demo' and
-                    user_id != 'test' and
-                    not user_id.startswith('user_test') and
-                    img.get('success', False)):
-
-                    activities.append({
-                        'type': 'image_generated',
-                        'user_id': user_id,
-                        'user_email': img.get('user_email', f'{user_id}@user.com'),
-                        'timestamp': img.get('created_at', ''),
-                        'details': f"Generated: {img.get('prompt', 'Unknown prompt')[:50]}..."
-                    })
-
-            # Sort by timestamp and return last 10
-            activities.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
-            return activities[:10]
+            aggregates = aggregates or self._get_platform_aggregates()
+
+            # Return the 10 most recent without sorting everything
+            return heapq.nlargest(10, aggregates['recent'], key=lambda x: x.get('timestamp', ''))
 
         except Exception as e:
             logger.error(f"Failed to get real recent activity: {e}")
             return []
 
-    def _get_real_active_top_users(self) -> List[Dict[str, Any]]:
+    def _get_real_active_top_users(self, aggregates: Dict[str, Any] = None) -> List[Dict[str, Any]]:
         """Get real top users based on actual image generation"""
         try:
-            from services.persistent_storage import PersistentStorage
-            persistent_storage = PersistentStorage()
-            all_images = persistent_storage.get_all_images()
-
-            # Count images per real user
-            user_counts = {}
-            for img in all_images:
-                user_id = img.get('user_id')
-                if (user_id and
-                    user_id != 'demo' and
-                    user_id != 'test' and
-                    not user_id.startswith('user_test') and
-                    img.get('success', False)):
-
-                    if user_id not in user_counts:
-                        user_counts[user_id] = {
-                            'user_id': user_id,
-                            'email': img.get('user_email', f'{user_id}@user.com'),
-                            'images_generated': 0,
-                            'last_active': img.get('created_at', '')
-                        }
-
-                    user_counts[user_id]['images_generated'] += 1
-                    if img.get('created_at', '') > user_counts[user_id]['last_active']:
-                        user_counts[user_id]['last_active'] = img.get('created_at', '')
-
-            # Sort by image count and return top 5
-            top_users = sorted(user_counts.values(), key=lambda x: x['images_generated'], reverse=True)
-            return top_users[:5]
+            aggregates = aggregates or self._get_platform_aggregates()
+
+            # Return the top 5 by image count without sorting everything
+            return heapq.nlargest(5, aggregates['user_counts'].values(), key=lambda x: x['images_generated'])
 
         except Exception as e:
             logger.error(f"Failed to get real top users: {e}")
@@ -645,40 +615,13 @@ class AdminAnalytics:
                 'ai_service_status': 'unknown'
             }
 
-    def _get_real_user_trends(self, image_count: int) -> Dict[str, Any]:
+    def _get_real_user_trends(self, image_count: int, aggregates: Dict[str, Any] = None) -> Dict[str, Any]:
         """Get real usage trends from actual user data"""
         try:
-            from services.persistent_storage import PersistentStorage
-            from datetime import datetime, timedelta
-
-            persistent_storage = PersistentStorage()
-            all_images = persistent_storage.get_all_images()
-
-            # Count real user images by day (last 7 days)
-            daily_counts = [0] * 7
-            today = datetime.utcnow().date()
-
-            for img in all_images:
-                user_id = img.get('user_id')
-                created_at = img.get('created_at', '')
-
-                if (user_id and
-                    user_id != 'demo' and
-                    user_id != 'test' and
-                    not user_id.startswith('user_test') and
-                    img.get('success', False) and
-                    created_at):
-
-                    try:
-                        img_date = datetime.fromisoformat(created_at.replace('Z', '+00:00')).date()
-                        days_ago = (today - img_date).days
-                        if 0 <= days_ago < 7:
-                            daily_counts[6 - days_ago] += 1
-                    except:
-                        pass
+            aggregates = aggregates or self._get_platform_aggregates()
 
             return {
-                'daily_generations': daily_counts,
+                'daily_generations': list(aggregates['daily_counts']),
                 'weekly_users': [len(set())],  # Would need more complex logic for weekly unique users
                 'monthly_growth': [image_count],
                 'hourly_activity': [0] * 24  # Would need hourly breakdown
@@ -703,40 +646,6 @@ class AdminAnalytics:
             logger.error(f"Failed to get actual uptime: {e}")
             return 0.0
 
-    def _get_fallback_stats(self) -> Dict[str, Any]:
-        """Fallback stats if real data collection fails"""
-        current_time = datetime.utcnow()
-        
-        return {
-            'platform_stats': {
-                'total_users': 1,
-                'total_images_generated': 0,
-                'total_storage_used_mb': 0,
-                'active_users_today': 1,
-                'active_users_this_week': 1,
-                'active_users_this_month': 1,
-                'total_api_calls': 0,
-                'total_costs_usd': 0.0,
-                'last_updated': current_time.isoformat(),
-                'uptime_hours': 0.0,
-                'avg_response_time_ms': 0
-            },
-            'recent_activity': [],
-            'top_users': [],
-            'system_health': {
-                'api_status': 'unknown',
-                'database_status': 'unknown',
-                'storage_status': 'unknown',
-                'ai_service_status': 'unknown'
-            },
-            'usage_trends': {
-                'daily_generations': [0] * 7,
-                'weekly_users': [0] * 4,
-                'monthly_growth': [0] * 4,
-                'hourly_activity': [0] * 24
-            },
-            'security_events': []
-        }
 
 # Global instance
 admin_analytics = AdminAnalytics()
@@ -1,13 +1,48 @@
 import jwt
+import hashlib
+import threading
+import time
 import requests
+from requests.adapters import HTTPAdapter
+import orjson
+from cachetools import TLRUCache, TTLCache
+from concurrent.futures import ThreadPoolExecutor
 from flask import current_app
 import logging
 from datetime import datetime, timezone
 
 logger = logging.getLogger(__name__)
 
+# The service is created per request, so the keep-alive pool to api.clerk.com lives at module level
+_session = requests.Session()
+_session.mount('https://', HTTPAdapter(pool_connections=10, pool_maxsize=50))
+
+# Verified token payloads keyed by a token fingerprint; entries never outlive the token's exp
+TOKEN_CACHE_TTL = 300
+_token_cache = TLRUCache(
+    maxsize=4096,
+    ttu=lambda _key, payload, now: min(now + TOKEN_CACHE_TTL, payload['exp']),
+    timer=time.time
+)
+_token_cache_lock = threading.Lock()
+
+# Longer bearer values are rejected before any decoding work
+MAX_TOKEN_LENGTH = 8192
+
+# Normalized profiles keyed by user id as (fetched_at, profile); past half the TTL an entry
+# is still served while one background refresh per user fetches a fresh copy
+PROFILE_CACHE_TTL = 60
+_profile_cache = TTLCache(maxsize=4096, ttl=PROFILE_CACHE_TTL, timer=time.monotonic)
+_profile_cache_lock = threading.Lock()
+_profile_refreshing = set()
+_profile_refresh_executor = ThreadPoolExecutor(max_workers=2)
+
 class ClerkAuthService:
     """Service for handling Clerk authentication"""
+
+    # Decode arguments shared by every verify_token call
+    _JWT_OPTIONS = {"verify_signature": False}
+    _JWT_ALGS = ('RS256',)
     
     def __init__(self):
         self.secret_key = current_app.config.get('CLERK_SECRET_KEY')
@@ -16,24 +51,29 @@ class ClerkAuthService:
         
         if not self.secret_key:
             raise ValueError("CLERK_SECRET_KEY is required")
-    
-    def _get_headers(self):
-        """Get headers for Clerk API requests"""
-        return {
+
+        # Headers for Clerk API requests, built once per service
+        self._headers = {
             'Authorization': f'Bearer {self.secret_key}',
             'Content-Type': 'application/json'
         }
     
     def verify_token(self, token):
         """Verify JWT token with Clerk"""
+        # A JWT is three dot-separated segments; reject anything else without hashing or decoding it
+        if not token or len(token) > MAX_TOKEN_LENGTH or token.count('.') != 2:
+            return None
+
         try:
-            # For development, we'll do basic JWT decoding
-            # In production, you should verify with Clerk's public key
-            payload = jwt.decode(
-                token,
-                options={"verify_signature": False},  # Disable signature verification for development
-                algorithms=['RS256']
-            )
+            # Fingerprint the token so the cache never holds raw bearer tokens
+            cache_key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+            with _token_cache_lock:
+                cached = _token_cache.get(cache_key)
+            if cached is not None and datetime.now(timezone.utc).timestamp() <= cached['exp']:
+                return dict(cached)
+
+            # For development, we'll do basic JWT decoding without signature verification
+            payload = jwt.decode(token, options=self._JWT_OPTIONS, algorithms=self._JWT_ALGS)
             
             # Check token expiration
             if 'exp' in payload:
@@ -47,6 +87,11 @@ class ClerkAuthService:
                 logger.warning("Invalid token issuer")
                 return None
             
+            # Only cache tokens that passed validation and carry a numeric expiry
+            if isinstance(payload.get('exp'), (int, float)):
+                with _token_cache_lock:
+                    _token_cache[cache_key] = dict(payload)
+            
             return payload
             
         except jwt.InvalidTokenError as e:
@@ -56,30 +101,64 @@ class ClerkAuthService:
             logger.error(f"Token verification error: {str(e)}")
             return None
     
+    @staticmethod
+    def _normalize_profile(user_data):
+        """Reduce a Clerk user object to the profile fields the app uses"""
+        return {
+            'id': user_data.get('id'),
+            'email': user_data.get('email_addresses', [{}])[0].get('email_address'),
+            'first_name': user_data.get('first_name'),
+            'last_name': user_data.get('last_name'),
+            'username': user_data.get('username'),
+            'profile_image_url': user_data.get('profile_image_url'),
+            'created_at': user_data.get('created_at'),
+            'updated_at': user_data.get('updated_at'),
+            'last_sign_in_at': user_data.get('last_sign_in_at')
+        }
+
     def get_user_profile(self, user_id):
-        """Get user profile from Clerk"""
+        """Get user profile from Clerk, served from cache while it is fresh enough"""
+        with _profile_cache_lock:
+            cached = _profile_cache.get(user_id)
+            refresh = (cached is not None and
+                       time.monotonic() - cached[0] > PROFILE_CACHE_TTL / 2 and
+                       user_id not in _profile_refreshing)
+            if refresh:
+                _profile_refreshing.add(user_id)
+
+        if cached is None:
+            return self._fetch_user_profile(user_id)
+
+        if refresh:
+            _profile_refresh_executor.submit(self._refresh_user_profile, user_id)
+        return dict(cached[1])
+
+    def _refresh_user_profile(self, user_id):
+        """Background refresh of a cached profile"""
+        try:
+            self._fetch_user_profile(user_id)
+        finally:
+            with _profile_cache_lock:
+                _profile_refreshing.discard(user_id)
+
+    def _fetch_user_profile(self, user_id):
+        """Fetch a user profile from Clerk and update the profile cache"""
         try:
             url = f"{self.base_url}/users/{user_id}"
-            response = requests.get(url, headers=self._get_headers(), timeout=10)
+            response = _session.get(url, headers=self._headers, timeout=10)
             
             if response.status_code == 200:
-                user_data = response.json()
-                return {
-                    'id': user_data.get('id'),
-                    'email': user_data.get('email_addresses', [{}])[0].get('email_address'),
-                    'first_name': user_data.get('first_name'),
-                    'last_name': user_data.get('last_name'),
-                    'username': user_data.get('username'),
-                    'profile_image_url': user_data.get('profile_image_url'),
-                    'created_at': user_data.get('created_at'),
-                    'updated_at': user_data.get('updated_at'),
-                    'last_sign_in_at': user_data.get('last_sign_in_at')
-                }
+                profile = self._normalize_profile(orjson.loads(response.content))
+                with _profile_cache_lock:
+                    _profile_cache[user_id] = (time.monotonic(), profile)
+                return dict(profile)
             elif response.status_code == 404:
                 logger.warning(f"User not found: {user_id}")
+                with _profile_cache_lock:
+                    _profile_cache.pop(user_id, None)
                 return None
             else:
-                logger.error(f"Clerk API error: {response.status_code} - {response.text}")
+                logger.error("Clerk API error: %s - %r", response.status_code, response.content[:500])
                 return None
                 
         except requests.RequestException as e:
@@ -93,15 +172,18 @@ class ClerkAuthService:
         """Update user profile in Clerk"""
         try:
             url = f"{self.base_url}/users/{user_id}"
-            response = requests.patch(
+            response = _session.patch(
                 url, 
                 json=update_data, 
-                headers=self._get_headers(),
+                headers=self._headers,
                 timeout=10
             )
             
             if response.status_code == 200:
-                user_data = response.json()
+                user_data = orjson.loads(response.content)
+                # The PATCH response is the full user, so it replaces the cached profile
+                with _profile_cache_lock:
+                    _profile_cache[user_id] = (time.monotonic(), self._normalize_profile(user_data))
                 return {
                     'id': user_data.get('id'),
                     'email': user_data.get('email_addresses', [{}])[0].get('email_address'),
@@ -112,7 +194,7 @@ class ClerkAuthService:
                     'updated_at': user_data.get('updated_at')
                 }
             else:
-                logger.error(f"Clerk API error: {response.status_code} - {response.text}")
+                logger.error("Clerk API error: %s - %r", response.status_code, response.content[:500])
                 return None
                 
         except requests.RequestException as e:
@@ -126,10 +208,10 @@ class ClerkAuthService:
         """Get user sessions from Clerk"""
         try:
             url = f"{self.base_url}/users/{user_id}/sessions"
-            response = requests.get(url, headers=self._get_headers(), timeout=10)
+            response = _session.get(url, headers=self._headers, timeout=10)
             
             if response.status_code == 200:
-                sessions_data = response.json()
+                sessions_data = orjson.loads(response.content)
                 return [
                     {
                         'id': session.get('id'),
@@ -141,7 +223,7 @@ class ClerkAuthService:
                     for session in sessions_data
                 ]
             else:
-                logger.error(f"Clerk API error: {response.status_code} - {response.text}")
+                logger.error("Clerk API error: %s - %r", response.status_code, response.content[:500])
                 return []
                 
         except requests.RequestException as e:
@@ -155,7 +237,7 @@ class ClerkAuthService:
         """Revoke a user session in Clerk"""
         try:
             url = f"{self.base_url}/sessions/{session_id}/revoke"
-            response = requests.post(url, headers=self._get_headers(), timeout=10)
+            response = _session.post(url, headers=self._headers, timeout=10)
             
             return response.status_code == 200
             
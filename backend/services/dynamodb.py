@@ -1,13 +1,159 @@
 import boto3
+from boto3.dynamodb.conditions import Attr, Key
+from concurrent.futures import ThreadPoolExecutor
 from botocore.exceptions import ClientError, NoCredentialsError
 from flask import current_app
 import logging
 from datetime import datetime, timedelta
 from decimal import Decimal
 import json
+import base64
+from functools import lru_cache
+from itertools import islice
+import threading
+import zstandard as zstd
 
 logger = logging.getLogger(__name__)
 
+# Long prompt text is stored zstd-compressed in a "<field>_z" Binary attribute.
+# Shorter strings stay as plain attributes since the frame overhead outweighs the saving.
+COMPRESSED_TEXT_FIELDS = ('prompt', 'negative_prompt')
+COMPRESSION_MIN_BYTES = 200
+COMPRESSION_LEVEL = 3
+
+# Parallel scan segments for the full-table admin listing
+ADMIN_SCAN_SEGMENTS = 8
+
+# Attributes read by _row_to_admin_image; placeholders avoid reserved words like "timestamp"
+ADMIN_IMAGE_ATTRIBUTES = (
+    'id', 'user_id', 'user_email', 'prompt', 'prompt_z', 'width', 'height', 'model',
+    'created_at', 'timestamp', 'file_url', 'url', 'thumbnail_url', 'is_favorite', 'file_size'
+)
+ADMIN_IMAGE_PROJECTION = ', '.join(f'#a{index}' for index in range(len(ADMIN_IMAGE_ATTRIBUTES)))
+ADMIN_IMAGE_PROJECTION_NAMES = {f'#a{index}': name for index, name in enumerate(ADMIN_IMAGE_ATTRIBUTES)}
+
+# Placeholder accounts excluded from platform analytics
+EXCLUDED_USER_IDS = ['demo', 'test']
+
+# boto3 resources shared across requests, keyed by credentials and region
+_resources = {}
+_resources_lock = threading.Lock()
+
+def _get_dynamodb_resource(access_key_id, secret_access_key, region):
+    """Return the process-wide DynamoDB resource for these credentials"""
+    cache_key = (access_key_id, secret_access_key, region)
+    resource = _resources.get(cache_key)
+    if resource is None:
+        with _resources_lock:
+            resource = _resources.get(cache_key)
+            if resource is None:
+                resource = boto3.resource(
+                    'dynamodb',
+                    aws_access_key_id=access_key_id,
+                    aws_secret_access_key=secret_access_key,
+                    region_name=region
+                )
+                _resources[cache_key] = resource
+    return resource
+
+# (table, index) pairs already reported missing, so the scan fallback warns once per process
+_missing_indexes = set()
+
+def _is_missing_index_error(error, table, index_name):
+    """Whether a ClientError means the index isn't provisioned, warning once per table and index"""
+    details = error.response.get('Error', {})
+    # Only a missing index falls back; other validation errors are real query bugs
+    missing = details.get('Code') == 'ResourceNotFoundException' or (
+        details.get('Code') == 'ValidationException' and index_name in details.get('Message', '')
+    )
+    if missing and (table.name, index_name) not in _missing_indexes:
+        _missing_indexes.add((table.name, index_name))
+        logger.warning(f"Index {index_name} unavailable on {table.name}, scanning: {str(error)}")
+    return missing
+
+@lru_cache(maxsize=1)
+def _date_boundaries(minute):
+    """Gallery filter boundaries for a given minute"""
+    week_ago = (minute - timedelta(days=7)).isoformat()
+    month_start = minute.replace(day=1, hour=0, minute=0).isoformat()
+    return week_ago, month_start
+
+def _week_ago_iso():
+    """ISO timestamp 7 days ago, recomputed at most once a minute"""
+    return _date_boundaries(datetime.utcnow().replace(second=0, microsecond=0))[0]
+
+def _month_start_iso():
+    """ISO timestamp for the start of the current month"""
+    return _date_boundaries(datetime.utcnow().replace(second=0, microsecond=0))[1]
+
+_MB = 1.0 / (1024 * 1024)
+
+def _row_to_admin_image(item):
+    """Convert a projected DynamoDB image item to the admin panel format"""
+    get = item.get
+    user_email = get('user_email')
+    prompt_z = get('prompt_z')
+    file_size = get('file_size')
+    return {
+        'id': get('id', ''),
+        'user_id': get('user_id', ''),
+        'user_email': user_email if user_email is not None else f"{get('user_id', 'unknown')}@user.com",
+        'prompt': zstd.decompress(bytes(prompt_z)).decode('utf-8') if prompt_z is not None else get('prompt', ''),
+        'width': int(get('width', 1024)),
+        'height': int(get('height', 1024)),
+        'model': get('model', 'FLUX.1-schnell'),
+        'created_at': get('created_at', get('timestamp', '')),
+        'file_url': get('file_url', get('url', '')),
+        'thumbnail_url': get('thumbnail_url', get('url', '')),
+        'is_favorite': get('is_favorite', False),
+        'file_size_mb': float(file_size) * _MB if file_size else 2.0,
+        'success': True
+    }
+
+def _replace_leaves(obj, leaf_type, convert):
+    """Convert leaf_type values nested in dicts/lists, copying only containers that change"""
+    obj_type = type(obj)
+    if obj_type is leaf_type:
+        return convert(obj)
+    if obj_type is dict:
+        converted = None
+        for key, value in obj.items():
+            new_value = _replace_leaves(value, leaf_type, convert)
+            if new_value is not value:
+                if converted is None:
+                    converted = dict(obj)
+                converted[key] = new_value
+        return obj if converted is None else converted
+    if obj_type is list:
+        converted = None
+        for index, value in enumerate(obj):
+            new_value = _replace_leaves(value, leaf_type, convert)
+            if new_value is not value:
+                if converted is None:
+                    converted = list(obj)
+                converted[index] = new_value
+        return obj if converted is None else converted
+    return obj
+
+def encode_cursor(key):
+    """Encode a DynamoDB key as an opaque pagination cursor"""
+    return base64.urlsafe_b64encode(json.dumps(key).encode('utf-8')).decode('ascii')
+
+class InvalidCursorError(ValueError):
+    """A pagination cursor that is malformed or that DynamoDB rejected as a start key"""
+
+def decode_cursor(cursor):
+    """Decode a pagination cursor back into a DynamoDB key (empty means first page); InvalidCursorError if malformed"""
+    if not cursor:
+        return None
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, UnicodeError):
+        raise InvalidCursorError("Invalid pagination cursor")
+    if not isinstance(key, dict) or 'id' not in key:
+        raise InvalidCursorError("Invalid pagination cursor")
+    return key
+
 class DynamoDBService:
     """Service for handling DynamoDB operations"""
     
@@ -16,16 +162,16 @@ class DynamoDBService:
         self.images_table = current_app.config.get('DYNAMODB_TABLE_IMAGES')
         self.users_table = current_app.config.get('DYNAMODB_TABLE_USERS')
         self.generations_table = current_app.config.get('DYNAMODB_TABLE_GENERATIONS')
+        self.images_user_index = current_app.config.get('DYNAMODB_IMAGES_USER_INDEX', 'user-id-created-at-index')
         
         if not all([self.images_table, self.users_table, self.generations_table]):
             raise ValueError("DynamoDB table names are required")
         
         try:
-            self.dynamodb = boto3.resource(
-                'dynamodb',
-                aws_access_key_id=current_app.config.get('AWS_ACCESS_KEY_ID'),
-                aws_secret_access_key=current_app.config.get('AWS_SECRET_ACCESS_KEY'),
-                region_name=self.region
+            self.dynamodb = _get_dynamodb_resource(
+                current_app.config.get('AWS_ACCESS_KEY_ID'),
+                current_app.config.get('AWS_SECRET_ACCESS_KEY'),
+                self.region
             )
             
             # Get table references
@@ -45,6 +191,7 @@ class DynamoDBService:
         try:
             # Convert float values to Decimal for DynamoDB
             item = self._convert_floats_to_decimal(metadata)
+            item = self._compress_text_fields(item)
             
             self.images.put_item(Item=item)
             
@@ -88,7 +235,7 @@ class DynamoDBService:
                 }
             
             # Convert Decimal values back to float
-            image_data = self._convert_decimals_to_float(item)
+            image_data = self._decompress_text_fields(self._convert_decimals_to_float(item))
             
             return {
                 'success': True,
@@ -108,70 +255,81 @@ class DynamoDBService:
                 'error': f"Failed to fetch image: {str(e)}"
             }
     
-    def get_user_images(self, user_id, page=1, limit=20, sort='newest', filter_type='all', search=''):
+    def get_user_images(self, user_id, page=1, limit=20, sort='newest', filter_type='all', search='', cursor=None):
         """Get user's images with pagination and filtering"""
         try:
-            # Calculate pagination
-            offset = (page - 1) * limit
-
-            # Use scan instead of query since we might not have GSI set up
-            filter_expression = 'user_id = :user_id'
-            expression_values = {':user_id': user_id}
+            # Key condition on the user/created_at GSI; date windows go into the sort key range
+            key_condition = Key('user_id').eq(user_id)
+            filter_condition = None
 
-            # Add filter for favorites
             if filter_type == 'favorites':
-                filter_expression += ' AND is_favorite = :is_favorite'
-                expression_values[':is_favorite'] = True
+                filter_condition = Attr('is_favorite').eq(True)
             elif filter_type == 'recent':
                 # Filter for last 7 days
-                from datetime import datetime, timedelta
-                week_ago = (datetime.utcnow() - timedelta(days=7)).isoformat()
-                filter_expression += ' AND created_at >= :week_ago'
-                expression_values[':week_ago'] = week_ago
+                key_condition &= Key('created_at').gt(_week_ago_iso())
+            elif filter_type == 'this-month':
+                key_condition &= Key('created_at').gt(_month_start_iso())
 
-            # Add search filter
+            # Add search filter (compressed prompts are matched after decompression below)
             if search:
-                filter_expression += ' AND contains(prompt, :search)'
-                expression_values[':search'] = search
-
-            # Scan the table with filters
-            response = self.images.scan(
-                FilterExpression=filter_expression,
-                ExpressionAttributeValues=expression_values,
-                Limit=limit * 3  # Get more items to account for filtering
+                search_condition = Attr('prompt').contains(search) | Attr('prompt_z').exists()
+                filter_condition = search_condition if filter_condition is None else filter_condition & search_condition
+
+            use_cursor = cursor is not None and sort in ('newest', 'oldest')
+            offset = (page - 1) * limit
+
+            # Page mode in index order counts server-side and reads only through the requested page;
+            # a search has to re-check compressed prompts, so its total needs every candidate item
+            total_count = None
+            if not use_cursor and sort in ('newest', 'oldest') and not search:
+                total_count = self._count_user_items(self.images, self.images_user_index, key_condition, filter_condition)
+
+            if use_cursor:
+                page_size = limit + 1
+            elif total_count is not None:
+                page_size = offset + limit
+            else:
+                page_size = None
+            items = self._iter_user_items(
+                self.images,
+                self.images_user_index,
+                key_condition,
+                filter_condition,
+                ascending=sort == 'oldest',
+                start_key=decode_cursor(cursor) if use_cursor else None,
+                page_size=page_size
             )
-            
-            items = response.get('Items', [])
-            
-            # Apply filtering
-            if filter_type == 'favorites':
-                items = [item for item in items if item.get('is_favorite', False)]
-            elif filter_type == 'recent':
-                week_ago = (datetime.utcnow() - timedelta(days=7)).isoformat()
-                items = [item for item in items if item.get('created_at', '') > week_ago]
-            elif filter_type == 'this-month':
-                month_start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0).isoformat()
-                items = [item for item in items if item.get('created_at', '') > month_start]
-            
-            # Apply search filter
-            if search:
-                search_lower = search.lower()
-                items = [
-                    item for item in items 
-                    if search_lower in item.get('prompt', '').lower()
-                ]
-            
-            # Apply sorting
-            if sort == 'oldest':
-                items.sort(key=lambda x: x.get('created_at', ''))
-            elif sort == 'prompt':
-                items.sort(key=lambda x: x.get('prompt', '').lower())
-            elif sort == 'favorites':
-                items.sort(key=lambda x: (not x.get('is_favorite', False), x.get('created_at', '')), reverse=True)
-            
-            # Apply pagination
-            total_count = len(items)
-            paginated_items = items[offset:offset + limit]
+            items = self._decompress_search_matches(items, search)
+
+            if use_cursor:
+                # Cursor pagination only reads as far as the requested page
+                paginated_items, pagination = self._cursor_page(items, limit)
+            else:
+                if total_count is not None:
+                    paginated_items = [item for item, _ in islice(items, offset, offset + limit)] if total_count > offset else []
+                else:
+                    items = [item for item, _ in items]
+
+                    # Apply sorting
+                    if sort == 'newest':
+                        items.sort(key=lambda x: x.get('created_at', ''), reverse=True)
+                    elif sort == 'oldest':
+                        items.sort(key=lambda x: x.get('created_at', ''))
+                    elif sort == 'prompt':
+                        items.sort(key=lambda x: x.get('prompt', '').lower())
+                    elif sort == 'favorites':
+                        items.sort(key=lambda x: (not x.get('is_favorite', False), x.get('created_at', '')), reverse=True)
+
+                    # Apply pagination
+                    total_count = len(items)
+                    paginated_items = items[offset:offset + limit]
+                pagination = {
+                    'page': page,
+                    'limit': limit,
+                    'total': total_count,
+                    'has_more': total_count > offset + limit,
+                    'total_pages': (total_count + limit - 1) // limit
+                }
             
             # Convert Decimal values
             images = [self._convert_decimals_to_float(item) for item in paginated_items]
@@ -180,15 +338,16 @@ class DynamoDBService:
                 'success': True,
                 'data': {
                     'images': images,
-                    'pagination': {
-                        'page': page,
-                        'limit': limit,
-                        'total': total_count,
-                        'total_pages': (total_count + limit - 1) // limit
-                    }
+                    'pagination': pagination
                 }
             }
             
+        except InvalidCursorError as e:
+            return {
+                'success': False,
+                'error': str(e),
+                'invalid_cursor': True
+            }
         except ClientError as e:
             logger.error(f"DynamoDB query error: {str(e)}")
             return {
@@ -205,21 +364,29 @@ class DynamoDBService:
     def delete_image(self, image_id, user_id):
         """Delete image metadata"""
         try:
-            # First verify the image belongs to the user
-            get_result = self.get_image_by_id(image_id, user_id)
-            if not get_result['success']:
-                return get_result
-            
-            # Delete the item
-            self.images.delete_item(
-                Key={'id': image_id}
+            # Delete only if the image belongs to the user, in a single round trip;
+            # the old item comes back so callers can clean up its S3 object
+            response = self.images.delete_item(
+                Key={'id': image_id},
+                ConditionExpression=Attr('user_id').eq(user_id),
+                ReturnValues='ALL_OLD'
             )
             
             logger.info(f"Image metadata deleted: {image_id}")
             
-            return {'success': True}
+            return {
+                'success': True,
+                'data': self._decompress_text_fields(self._convert_decimals_to_float(response.get('Attributes', {})))
+            }
             
         except ClientError as e:
+            if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                # Missing or owned by someone else; other errors (e.g. a missing table) are not 404s
+                return {
+                    'success': False,
+                    'error': 'Image not found',
+                    'not_found': True
+                }
             logger.error(f"DynamoDB delete error: {str(e)}")
             return {
                 'success': False,
@@ -235,16 +402,12 @@ class DynamoDBService:
     def update_image_favorite(self, image_id, user_id, is_favorite):
         """Update image favorite status"""
         try:
-            # First verify the image belongs to the user
-            get_result = self.get_image_by_id(image_id, user_id)
-            if not get_result['success']:
-                return get_result
-            
-            # Update favorite status
+            # Update only if the image exists and belongs to the user, in a single round trip
             self.images.update_item(
                 Key={'id': image_id},
                 UpdateExpression='SET is_favorite = :is_favorite',
-                ExpressionAttributeValues={':is_favorite': is_favorite}
+                ConditionExpression='user_id = :user_id',
+                ExpressionAttributeValues={':is_favorite': is_favorite, ':user_id': user_id}
             )
             
             logger.info(f"Image favorite status updated: {image_id} -> {is_favorite}")
@@ -252,6 +415,13 @@ class DynamoDBService:
             return {'success': True}
             
         except ClientError as e:
+            if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                # Missing or owned by someone else; other errors (e.g. a missing table) are not 404s
+                return {
+                    'success': False,
+                    'error': 'Image not found',
+                    'not_found': True
+                }
             logger.error(f"DynamoDB update error: {str(e)}")
             return {
                 'success': False,
@@ -284,51 +454,72 @@ class DynamoDBService:
             logger.error(f"Generation record error: {str(e)}")
             return {'success': False, 'error': str(e)}
 
-    def get_user_generation_history(self, user_id, page=1, limit=20):
+    def get_user_generation_history(self, user_id, page=1, limit=20, cursor=None):
         """Get user's generation history with pagination"""
         try:
-            # Calculate pagination
+            index_name = 'user-id-created-at-index'
+            key_condition = Key('user_id').eq(user_id)
             offset = (page - 1) * limit
 
-            # Use scan instead of query since we might not have GSI set up
-            response = self.generations.scan(
-                FilterExpression='user_id = :user_id',
-                ExpressionAttributeValues={':user_id': user_id},
-                Limit=limit * 2  # Get more items to account for filtering
+            # Page mode counts server-side and reads only through the requested page
+            total_count = None
+            if cursor is None:
+                total_count = self._count_user_items(self.generations, index_name, key_condition)
+
+            if cursor is not None:
+                page_size = limit + 1
+            elif total_count is not None:
+                page_size = offset + limit
+            else:
+                page_size = None
+            items = self._iter_user_items(
+                self.generations,
+                index_name,
+                key_condition,
+                start_key=decode_cursor(cursor) if cursor is not None else None,
+                page_size=page_size
             )
 
-            items = response.get('Items', [])
+            if cursor is not None:
+                # Cursor pagination only reads as far as the requested page
+                paginated_items, pagination = self._cursor_page(items, limit)
+            else:
+                if total_count is not None:
+                    paginated_items = [item for item, _ in islice(items, offset, offset + limit)] if total_count > offset else []
+                else:
+                    items = [item for item, _ in items]
 
-            # Sort by created_at (newest first)
-            items.sort(key=lambda x: x.get('created_at', ''), reverse=True)
+                    # Sort by created_at (newest first)
+                    items.sort(key=lambda x: x.get('created_at', ''), reverse=True)
 
-            # Apply offset and limit
-            paginated_items = items[offset:offset + limit]
+                    # Apply offset and limit
+                    total_count = len(items)
+                    paginated_items = items[offset:offset + limit]
+                pagination = {
+                    'page': page,
+                    'limit': limit,
+                    'total': total_count,
+                    'has_more': total_count > offset + limit,
+                    'total_pages': (total_count + limit - 1) // limit
+                }
 
             # Convert Decimal to float for JSON serialization
-            history = []
-            for item in paginated_items:
-                history_item = self._convert_decimals_to_float(item)
-                history.append(history_item)
-
-            # Calculate pagination info
-            total_count = len(items)
-            has_more = len(items) > offset + limit
+            history = [self._convert_decimals_to_float(item) for item in paginated_items]
 
             return {
                 'success': True,
                 'data': {
                     'history': history,
-                    'pagination': {
-                        'page': page,
-                        'limit': limit,
-                        'total': total_count,
-                        'has_more': has_more,
-                        'total_pages': (total_count + limit - 1) // limit
-                    }
+                    'pagination': pagination
                 }
             }
 
+        except InvalidCursorError as e:
+            return {
+                'success': False,
+                'error': str(e),
+                'invalid_cursor': True
+            }
         except ClientError as e:
             logger.error(f"DynamoDB query error: {str(e)}")
             return {
@@ -347,91 +538,214 @@ class DynamoDBService:
         try:
             today = datetime.utcnow().date().isoformat()
             
-            response = self.generations.query(
-                IndexName='user-id-created-at-index',
-                KeyConditionExpression='user_id = :user_id AND begins_with(created_at, :today)',
-                ExpressionAttributeValues={
+            query_kwargs = {
+                'IndexName': 'user-id-created-at-index',
+                'KeyConditionExpression': 'user_id = :user_id AND begins_with(created_at, :today)',
+                'ExpressionAttributeValues': {
                     ':user_id': user_id,
                     ':today': today
-                }
-            )
+                },
+                'Select': 'COUNT'
+            }
             
-            return len(response.get('Items', []))
+            # COUNT returns no items; sum across pages in case the index read hits the 1 MB limit
+            count = 0
+            while True:
+                response = self.generations.query(**query_kwargs)
+                count += response.get('Count', 0)
+                if 'LastEvaluatedKey' not in response:
+                    return count
+                query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
             
         except Exception as e:
             logger.error(f"Daily count error: {str(e)}")
             return 0
     
+    def _iter_user_items(self, table, index_name, key_condition, filter_condition=None,
+                         ascending=False, start_key=None, page_size=None):
+        """Yield (item, cursor_key) pairs for one user via the user/created_at index, scanning if it is missing"""
+        request = {
+            'IndexName': index_name,
+            'KeyConditionExpression': key_condition,
+            'ScanIndexForward': ascending
+        }
+        if filter_condition is not None:
+            request['FilterExpression'] = filter_condition
+        if page_size:
+            request['Limit'] = page_size
+        if start_key:
+            request['ExclusiveStartKey'] = start_key
+        read = table.query
+        key_attrs = ('id', 'user_id', 'created_at')
+
+        try:
+            response = read(**request)
+        except ClientError as e:
+            if not _is_missing_index_error(e, table, index_name):
+                if start_key and e.response.get('Error', {}).get('Code') == 'ValidationException':
+                    # A cursor edited to another user's key, or to one the index can't start from
+                    raise InvalidCursorError("Invalid pagination cursor")
+                raise
+            # Index not provisioned on this table yet, fall back to scanning it (unordered)
+            request = {
+                'FilterExpression': key_condition if filter_condition is None else key_condition & filter_condition
+            }
+            if page_size:
+                request['Limit'] = page_size
+            if start_key:
+                request['ExclusiveStartKey'] = {'id': start_key['id']}
+            read = table.scan
+            key_attrs = ('id',)
+            response = read(**request)
+
+        while True:
+            for item in response.get('Items', []):
+                yield item, {attr: item[attr] for attr in key_attrs}
+
+            if 'LastEvaluatedKey' not in response:
+                return
+            request['ExclusiveStartKey'] = response['LastEvaluatedKey']
+            response = read(**request)
+
+    def _count_user_items(self, table, index_name, key_condition, filter_condition=None):
+        """Count one user's items server-side with Select='COUNT', or None if the index is missing"""
+        request = {
+            'IndexName': index_name,
+            'KeyConditionExpression': key_condition,
+            'Select': 'COUNT'
+        }
+        if filter_condition is not None:
+            request['FilterExpression'] = filter_condition
+
+        total = 0
+        while True:
+            try:
+                response = table.query(**request)
+            except ClientError as e:
+                if not _is_missing_index_error(e, table, index_name):
+                    raise
+                return None
+            total += response.get('Count', 0)
+            if 'LastEvaluatedKey' not in response:
+                return total
+            request['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def _decompress_search_matches(self, items, search):
+        """Decompress (item, cursor_key) pairs, dropping compressed prompts that miss the search"""
+        search_lower = search.lower()
+        for item, key in items:
+            compressed = 'prompt_z' in item
+            item = self._decompress_text_fields(item)
+            # Plain prompts already matched contains() server-side; compressed ones can only be checked here
+            if search and compressed and search_lower not in item.get('prompt', '').lower():
+                continue
+            yield item, key
+
+    def _cursor_page(self, items, limit):
+        """Take one page from (item, cursor_key) pairs and build its cursor pagination info"""
+        # Read one extra item to learn whether another page exists
+        page_items = list(islice(items, limit + 1))
+        has_more = len(page_items) > limit
+        page_items = page_items[:limit]
+
+        return [item for item, _ in page_items], {
+            'limit': limit,
+            'has_more': has_more,
+            'next_cursor': encode_cursor(page_items[-1][1]) if has_more else None
+        }
+
     def _convert_floats_to_decimal(self, obj):
         """Convert float values to Decimal for DynamoDB"""
-        if isinstance(obj, dict):
-            return {k: self._convert_floats_to_decimal(v) for k, v in obj.items()}
-        elif isinstance(obj, list):
-            return [self._convert_floats_to_decimal(v) for v in obj]
-        elif isinstance(obj, float):
-            return Decimal(str(obj))
-        else:
-            return obj
+        return _replace_leaves(obj, float, lambda value: Decimal(str(value)))
+    
+    def _compress_text_fields(self, item):
+        """Replace long text fields with zstd-compressed Binary attributes"""
+        for field in COMPRESSED_TEXT_FIELDS:
+            value = item.get(field)
+            if not isinstance(value, str):
+                continue
+            encoded = value.encode('utf-8')
+            if len(encoded) >= COMPRESSION_MIN_BYTES:
+                # Copy before changing keys; the item may still be the caller's metadata dict
+                item = dict(item)
+                item[f"{field}_z"] = zstd.compress(encoded, COMPRESSION_LEVEL)
+                del item[field]
+        return item
+    
+    def _decompress_text_fields(self, item):
+        """Restore text fields stored by _compress_text_fields"""
+        for field in COMPRESSED_TEXT_FIELDS:
+            packed = item.pop(f"{field}_z", None)
+            if packed is not None:
+                item[field] = zstd.decompress(bytes(packed)).decode('utf-8')
+        return item
     
     def _convert_decimals_to_float(self, obj):
         """Convert Decimal values back to float"""
-        if isinstance(obj, dict):
-            return {k: self._convert_decimals_to_float(v) for k, v in obj.items()}
-        elif isinstance(obj, list):
-            return [self._convert_decimals_to_float(v) for v in obj]
-        elif isinstance(obj, Decimal):
-            return float(obj)
+        return _replace_leaves(obj, Decimal, float)
+
+    def _real_user_image_filter(self, since=None):
+        """Build a scan filter for real-user images with a prompt and timestamp"""
+        condition = (Attr('user_id').exists() &
+                     ~Attr('user_id').is_in(EXCLUDED_USER_IDS) &
+                     ~Attr('user_id').begins_with('user_test') &
+                     (Attr('prompt').exists() | Attr('prompt_z').exists()))
+        if since:
+            condition &= Attr('created_at').gte(since.isoformat())
         else:
-            return obj
+            condition &= (Attr('created_at').exists() | Attr('timestamp').exists())
+        return condition
+
+    def count_real_user_images(self, since=None):
+        """Count real-user images server-side without transferring the items"""
+        try:
+            scan_kwargs = {
+                'FilterExpression': self._real_user_image_filter(since),
+                'Select': 'COUNT'
+            }
+            count = 0
+            while True:
+                response = self.images.scan(**scan_kwargs)
+                count += response.get('Count', 0)
+                if 'LastEvaluatedKey' not in response:
+                    return count
+                scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+        except Exception as e:
+            logger.error(f"Real user image count error: {str(e)}")
+            return 0
+
+    def _scan_admin_segment(self, segment, total_segments):
+        """Scan one parallel-scan segment of the images table into admin rows"""
+        # The resource's client is thread-safe (unlike Table) and still returns deserialized items
+        client = self.dynamodb.meta.client
+        scan_kwargs = {
+            'TableName': self.images_table,
+            'Segment': segment,
+            'TotalSegments': total_segments,
+            'ProjectionExpression': ADMIN_IMAGE_PROJECTION,
+            'ExpressionAttributeNames': ADMIN_IMAGE_PROJECTION_NAMES
+        }
+        images = []
+        while True:
+            response = client.scan(**scan_kwargs)
+            for item in response.get('Items', []):
+                images.append(_row_to_admin_image(item))
+
+            if 'LastEvaluatedKey' not in response:
+                return images
+            scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
 
     def get_all_images_admin(self):
         """Get all images from all users for admin panel"""
         try:
-            # Scan the entire images table (admin only)
-            response = self.images.scan()
-
-            images = []
-            for item in response['Items']:
-                # Convert DynamoDB item to standard format
-                image_data = {
-                    'id': item.get('id', ''),
-                    'user_id': item.get('user_id', ''),
-                    'user_email': item.get('user_email', f"{item.get('user_id', 'unknown')}@user.com"),
-                    'prompt': item.get('prompt', ''),
-                    'width': int(item.get('width', 1024)),
-                    'height': int(item.get('height', 1024)),
-                    'model': item.get('model', 'FLUX.1-schnell'),
-                    'created_at': item.get('created_at', item.get('timestamp', '')),
-                    'file_url': item.get('file_url', item.get('url', '')),
-                    'thumbnail_url': item.get('thumbnail_url', item.get('url', '')),
-                    'is_favorite': item.get('is_favorite', False),
-                    'file_size_mb': float(item.get('file_size', 0)) / (1024 * 1024) if item.get('file_size') else 2.0,
-                    'success': True
-                }
-                images.append(image_data)
-
-            # Handle pagination for large datasets
-            while 'LastEvaluatedKey' in response:
-                response = self.images.scan(
-                    ExclusiveStartKey=response['LastEvaluatedKey']
+            # Scan the entire images table (admin only) as parallel segments
+            with ThreadPoolExecutor(max_workers=ADMIN_SCAN_SEGMENTS) as executor:
+                segments = executor.map(
+                    lambda segment: self._scan_admin_segment(segment, ADMIN_SCAN_SEGMENTS),
+                    range(ADMIN_SCAN_SEGMENTS)
                 )
-                for item in response['Items']:
-                    image_data = {
-                        'id': item.get('id', ''),
-                        'user_id': item.get('user_id', ''),
-                        'user_email': item.get('user_email', f"{item.get('user_id', 'unknown')}@user.com"),
-                        'prompt': item.get('prompt', ''),
-                        'width': int(item.get('width', 1024)),
-                        'height': int(item.get('height', 1024)),
-                        'model': item.get('model', 'FLUX.1-schnell'),
-                        'created_at': item.get('created_at', item.get('timestamp', '')),
-                        'file_url': item.get('file_url', item.get('url', '')),
-                        'thumbnail_url': item.get('thumbnail_url', item.get('url', '')),
-                        'is_favorite': item.get('is_favorite', False),
-                        'file_size_mb': float(item.get('file_size', 0)) / (1024 * 1024) if item.get('file_size') else 2.0,
-                        'success': True
-                    }
-                    images.append(image_data)
+                images = [image for segment_images in segments for image in segment_images]
 
             logger.info(f"Retrieved {len(images)} images for admin panel")
             return images
@@ -4,14 +4,73 @@ Ensures all images and user data persist across server restarts
 """
 
 import os
-import json
+import fcntl
+import heapq
+import shutil
+import tempfile
 import threading
+from collections import defaultdict
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Iterator
 import logging
+import orjson
 
 logger = logging.getLogger(__name__)
 
+# New images and generations are appended to "<file>.jsonl" logs; once a log holds this many
+# records it is folded into the JSON snapshot when the next backup is taken
+COMPACTION_INTERVAL = 200
+
+# Routes create a PersistentStorage per request, so the lock and open log handles are shared
+_storage_lock = threading.RLock()
+_log_handles = {}
+_log_counts = {}
+
+# Backup files kept per snapshot file after compaction
+MAX_BACKUPS_PER_FILE = 10
+
+# Snapshots and backups are written compact; only the small initial files are indented
+JSON_WRITE_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+# user_id -> that user's images, with the storage version it was built from
+_images_by_user = None
+_images_by_user_version = None
+
+# Parsed JSON files keyed by path, reused while the file's (inode, mtime_ns, size) is unchanged
+_json_cache = {}
+
+def _fsync_dir(dir_path: str):
+    """Make renames and newly created files in a directory durable"""
+    try:
+        fd = os.open(dir_path, os.O_RDONLY)
+    except OSError:
+        # Directories cannot be opened for fsync on every platform (e.g. Windows)
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+@contextmanager
+def _log_file_lock(data_dir: str):
+    """Hold the exclusive lock every process takes to append to or compact the logs"""
+    # Without it, a record another worker appends between compaction's read and its truncate is lost
+    with open(os.path.join(data_dir, '.logs.lock'), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _copy_records(data):
+    """Copy a cached JSON value deep enough that callers can modify its records"""
+    if type(data) is list:
+        return [dict(item) if type(item) is dict else item for item in data]
+    if type(data) is dict:
+        return {key: dict(value) if type(value) is dict else value for key, value in data.items()}
+    return data
+
 class PersistentStorage:
     """
     Persistent storage service that ensures data is never lost
@@ -23,10 +82,12 @@ class PersistentStorage:
         self.images_file = os.path.join(self.data_dir, 'images.json')
         self.users_file = os.path.join(self.data_dir, 'users.json')
         self.generations_file = os.path.join(self.data_dir, 'generations.json')
+        self.images_log = f"{self.images_file}.jsonl"
+        self.generations_log = f"{self.generations_file}.jsonl"
         self.backup_dir = os.path.join(self.data_dir, 'backups')
         
         # Thread lock for atomic operations
-        self._lock = threading.Lock()
+        self._lock = _storage_lock
         
         # Ensure directories exist
         self._ensure_directories()
@@ -49,43 +110,57 @@ class PersistentStorage:
         
         for file_path, default_data in files_to_init:
             if not os.path.exists(file_path):
-                self._write_json_atomic(file_path, default_data)
+                self._write_json_atomic(file_path, default_data, pretty=True)
                 logger.info(f"📁 Initialized persistent storage file: {file_path}")
     
-    def _write_json_atomic(self, file_path: str, data: Any):
+    def _write_json_atomic(self, file_path: str, data: Any, pretty: bool = False, sync_dir: bool = True):
         """Write JSON data atomically to prevent corruption"""
-        temp_path = f"{file_path}.tmp"
+        options = JSON_WRITE_OPTIONS | orjson.OPT_INDENT_2 if pretty else JSON_WRITE_OPTIONS
+        # A unique temp file per write, so concurrent writers (e.g. other worker processes) never share one
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(file_path), prefix='.tmp-', suffix='.json')
         try:
-            with open(temp_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
-            
-            # Atomic move
-            if os.path.exists(file_path):
-                backup_path = f"{file_path}.backup"
-                os.replace(file_path, backup_path)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(orjson.dumps(data, option=options))
+                # The data must be on disk before the rename makes it visible
+                f.flush()
+                os.fsync(f.fileno())
             
+            # Atomic move; readers see either the old file or the new one
+            _json_cache.pop(file_path, None)
             os.replace(temp_path, file_path)
             
+            # Callers writing several files pass sync_dir=False and sync the directory once
+            if sync_dir:
+                _fsync_dir(os.path.dirname(file_path))
+            
         except Exception as e:
-            if os.path.exists(temp_path):
+            try:
                 os.remove(temp_path)
+            except OSError:
+                pass
             raise e
     
-    def _read_json_safe(self, file_path: str, default: Any = None):
-        """Read JSON file safely with backup recovery"""
+    def _read_json_safe(self, file_path: str, default: Any = None, copy: bool = True):
+        """Read JSON file safely with backup recovery; copy=False returns the shared cached value, read-only"""
         try:
             if os.path.exists(file_path):
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                stat = os.stat(file_path)
+                signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+                cached = _json_cache.get(file_path)
+                if cached is None or cached[0] != signature:
+                    with open(file_path, 'rb') as f:
+                        cached = (signature, orjson.loads(f.read()))
+                    _json_cache[file_path] = cached
+                return _copy_records(cached[1]) if copy else cached[1]
         except Exception as e:
             logger.warning(f"Failed to read {file_path}: {e}")
             
-            # Try backup
-            backup_path = f"{file_path}.backup"
-            if os.path.exists(backup_path):
+            # Try the newest timestamped backup of this file
+            backup_path = self._latest_backup(file_path)
+            if backup_path:
                 try:
-                    with open(backup_path, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
+                    with open(backup_path, 'rb') as f:
+                        data = orjson.loads(f.read())
                         logger.info(f"Recovered data from backup: {backup_path}")
                         return data
                 except Exception as backup_error:
@@ -93,23 +168,106 @@ class PersistentStorage:
         
         return default if default is not None else []
     
+    def _latest_backup(self, file_path: str):
+        """Path of the newest timestamped backup of a snapshot file, if any"""
+        prefix = os.path.splitext(os.path.basename(file_path))[0] + '_'
+        try:
+            with os.scandir(self.backup_dir) as it:
+                names = [e.name for e in it if e.name.startswith(prefix) and e.name.endswith('.json')]
+        except OSError:
+            return None
+        return os.path.join(self.backup_dir, max(names)) if names else None
+    
+    def _append_jsonl(self, log_path: str, record: Dict[str, Any]) -> int:
+        """Append one record to a JSONL log and return how many records the log holds"""
+        handle = _log_handles.get(log_path)
+        if handle is None:
+            handle = open(log_path, 'ab', buffering=1 << 16)
+            _fsync_dir(os.path.dirname(log_path))
+            _log_handles[log_path] = handle
+            _log_counts[log_path] = sum(1 for _ in self._read_jsonl(log_path))
+        
+        # One write per record, flushed so other readers see it and synced so it survives a crash
+        with _log_file_lock(self.data_dir):
+            handle.write(orjson.dumps(record) + b'\n')
+            handle.flush()
+            os.fsync(handle.fileno())
+        _log_counts[log_path] += 1
+        return _log_counts[log_path]
+    
+    def _read_jsonl(self, log_path: str) -> Iterator[Dict[str, Any]]:
+        """Stream records from a JSONL log, skipping a torn trailing line"""
+        try:
+            with open(log_path, 'rb') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        yield orjson.loads(line)
+                    except orjson.JSONDecodeError:
+                        logger.warning(f"Skipping unreadable record in {log_path}")
+        except FileNotFoundError:
+            return
+    
+    def _load_images(self) -> List[Dict[str, Any]]:
+        """Load the images snapshot plus logged images, applying logged favorite changes"""
+        images = self._read_json_safe(self.images_file, [])
+        by_key = None
+        
+        for record in self._read_jsonl(self.images_log):
+            if record.get('op') == 'fav':
+                if by_key is None:
+                    by_key = {}
+                    for img in images:
+                        by_key.setdefault((img.get('id'), img.get('user_id')), img)
+                image = by_key.get((record['id'], record['user_id']))
+                if image is not None:
+                    image['is_favorite'] = record['val']
+            else:
+                images.append(record)
+                if by_key is not None:
+                    by_key.setdefault((record.get('id'), record.get('user_id')), record)
+        
+        return images
+    
+    def _user_index(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Images grouped by user_id, rebuilt when the files changed elsewhere; caller holds the lock"""
+        global _images_by_user, _images_by_user_version
+        version = self.version
+        if _images_by_user is None or version != _images_by_user_version:
+            index = defaultdict(list)
+            for img in self._load_images():
+                index[img.get('user_id')].append(img)
+            _images_by_user, _images_by_user_version = index, version
+        return _images_by_user
+    
+    def _user_index_if_current(self):
+        """The user index if it matches the files on disk, else None; caller holds the lock"""
+        if _images_by_user is not None and _images_by_user_version == self.version:
+            return _images_by_user
+        return None
+    
+    def _mark_user_index_current(self):
+        """Mark the user index as including the write just made; caller holds the lock"""
+        global _images_by_user_version
+        _images_by_user_version = self.version
+    
     def save_image(self, image_metadata: Dict[str, Any]):
         """Save image metadata to persistent storage"""
         with self._lock:
             try:
-                # Load existing images
-                images = self._read_json_safe(self.images_file, [])
-                
-                # Add new image
-                images.append(image_metadata)
+                index = self._user_index_if_current()
                 
-                # Save back to file
-                self._write_json_atomic(self.images_file, images)
+                # Append the new image; the snapshot is only rewritten on compaction
+                logged = self._append_jsonl(self.images_log, image_metadata)
+                if index is not None:
+                    index[image_metadata.get('user_id')].append(dict(image_metadata))
+                    self._mark_user_index_current()
                 
                 logger.info(f"💾 Image saved to persistent storage: {image_metadata.get('id', 'unknown')}")
                 
-                # Create backup every 10 images
-                if len(images) % 10 == 0:
+                # Back up and compact once the log has grown
+                if logged >= COMPACTION_INTERVAL:
                     self._create_backup()
                 
             except Exception as e:
@@ -119,14 +277,54 @@ class PersistentStorage:
     def get_all_images(self) -> List[Dict[str, Any]]:
         """Get all images from persistent storage"""
         with self._lock:
-            images = self._read_json_safe(self.images_file, [])
+            images = self._load_images()
             logger.info(f"📸 Retrieved {len(images)} images from persistent storage")
             return images
+
+    @property
+    def version(self):
+        """Change token for stored images; differs after every write from any process"""
+        try:
+            # Atomic writes replace the snapshot, so the inode changes along with mtime
+            stat = os.stat(self.images_file)
+            snapshot = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return None
+        try:
+            stat = os.stat(self.images_log)
+            return snapshot + (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return snapshot
+
+    def iter_all_images(self) -> Iterator[Dict[str, Any]]:
+        """Yield all images, snapshot records first and then logged ones, copying one record at a time"""
+        with self._lock:
+            # The parsed snapshot is shared with the read cache; the log is read whole under the lock
+            # so a concurrent compaction can't truncate it mid-stream, and it never exceeds
+            # COMPACTION_INTERVAL records
+            images = self._read_json_safe(self.images_file, [], copy=False)
+            logged = list(self._read_jsonl(self.images_log))
+        
+        # Favorite changes are logged as overrides of earlier records
+        favorites = {(record['id'], record['user_id']): record['val']
+                     for record in logged if record.get('op') == 'fav'}
+        
+        for source in (images, logged):
+            for img in source:
+                if img.get('op') == 'fav':
+                    continue
+                img = dict(img)
+                if favorites:
+                    key = (img.get('id'), img.get('user_id'))
+                    if key in favorites:
+                        img['is_favorite'] = favorites[key]
+                yield img
     
     def get_user_images(self, user_id: str) -> List[Dict[str, Any]]:
         """Get images for a specific user"""
-        all_images = self.get_all_images()
-        user_images = [img for img in all_images if img.get('user_id') == user_id]
+        with self._lock:
+            # Served from the in-memory user index; the snapshot is only parsed when it changes on disk
+            user_images = [dict(img) for img in self._user_index().get(user_id, ())]
         logger.info(f"👤 Retrieved {len(user_images)} images for user {user_id}")
         return user_images
     
@@ -134,13 +332,17 @@ class PersistentStorage:
         """Update image favorite status"""
         with self._lock:
             try:
-                images = self._read_json_safe(self.images_file, [])
-                
-                for img in images:
-                    if img.get('id') == image_id and img.get('user_id') == user_id:
+                for img in self._user_index().get(user_id, ()):
+                    if img.get('id') == image_id:
+                        # Log an override instead of rewriting the snapshot
+                        logged = self._append_jsonl(self.images_log, {
+                            'op': 'fav', 'id': image_id, 'user_id': user_id, 'val': is_favorite
+                        })
                         img['is_favorite'] = is_favorite
-                        self._write_json_atomic(self.images_file, images)
+                        self._mark_user_index_current()
                         logger.info(f"⭐ Updated favorite status for {image_id}: {is_favorite}")
+                        if logged >= COMPACTION_INTERVAL:
+                            self._create_backup()
                         return True
                 
                 logger.warning(f"Image not found for favorite update: {image_id}")
@@ -154,8 +356,6 @@ class PersistentStorage:
         """Save generation record"""
         with self._lock:
             try:
-                generations = self._read_json_safe(self.generations_file, [])
-                
                 generation_record = {
                     'id': f"{user_id}#{datetime.utcnow().isoformat()}",
                     'user_id': user_id,
@@ -164,28 +364,47 @@ class PersistentStorage:
                     'parameters': params
                 }
                 
-                generations.append(generation_record)
-                self._write_json_atomic(self.generations_file, generations)
+                logged = self._append_jsonl(self.generations_log, generation_record)
                 
                 logger.info(f"📝 Generation record saved: {image_id}")
                 
+                if logged >= COMPACTION_INTERVAL:
+                    self._create_backup()
+                
             except Exception as e:
                 logger.error(f"Failed to save generation record: {e}")
     
+    def _truncate_log(self, log_path: str):
+        """Empty a log whose records are now in the snapshot"""
+        # Truncate in place so append handles keep writing to the same file
+        with open(log_path, 'wb') as f:
+            os.fsync(f.fileno())
+        _log_counts[log_path] = 0
+    
     def _create_backup(self):
-        """Create timestamped backup of all data"""
+        """Create timestamped backup of all data and compact the append logs"""
         try:
             timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
             
-            # Backup images
-            images = self._read_json_safe(self.images_file, [])
-            backup_images_path = os.path.join(self.backup_dir, f'images_{timestamp}.json')
-            self._write_json_atomic(backup_images_path, images)
-            
-            # Backup generations
-            generations = self._read_json_safe(self.generations_file, [])
-            backup_gen_path = os.path.join(self.backup_dir, f'generations_{timestamp}.json')
-            self._write_json_atomic(backup_gen_path, generations)
+            # Appends from every process wait until the logs are folded in and emptied
+            with _log_file_lock(self.data_dir):
+                images = self._load_images()
+                generations = self._read_json_safe(self.generations_file, [])
+                generations.extend(self._read_jsonl(self.generations_log))
+                
+                # Fold the logs into the snapshots, encoding each once
+                self._write_json_atomic(self.images_file, images, sync_dir=False)
+                self._write_json_atomic(self.generations_file, generations, sync_dir=False)
+                
+                # Backups are byte copies of the new snapshots
+                self._copy_file(self.images_file, os.path.join(self.backup_dir, f'images_{timestamp}.json'))
+                self._copy_file(self.generations_file, os.path.join(self.backup_dir, f'generations_{timestamp}.json'))
+                
+                # Snapshots and backups must be durable before the logs are emptied
+                _fsync_dir(self.backup_dir)
+                _fsync_dir(self.data_dir)
+                self._truncate_log(self.images_log)
+                self._truncate_log(self.generations_log)
             
             logger.info(f"💾 Created backup: {timestamp}")
             
@@ -195,15 +414,31 @@ class PersistentStorage:
         except Exception as e:
             logger.error(f"Backup creation failed: {e}")
     
+    def _copy_file(self, src: str, dst: str):
+        """Copy a file (kernel-side via sendfile on Linux) and fsync the copy"""
+        shutil.copyfile(src, dst)
+        with open(dst, 'rb') as f:
+            os.fsync(f.fileno())
+    
     def _cleanup_old_backups(self):
-        """Keep only the last 10 backups"""
+        """Keep only the last 10 backups of each snapshot file"""
         try:
-            backup_files = [f for f in os.listdir(self.backup_dir) if f.endswith('.json')]
-            backup_files.sort(reverse=True)
+            # Grouped by file prefix ("images", "generations"): recovery looks backups up per file,
+            # and across prefixes the names would not sort by age
+            by_prefix = defaultdict(list)
+            with os.scandir(self.backup_dir) as it:
+                for entry in it:
+                    if entry.name.endswith('.json') and entry.is_file():
+                        by_prefix[entry.name.split('_', 1)[0]].append(entry)
             
-            # Remove old backups
-            for old_backup in backup_files[20:]:  # Keep 20 files (10 images + 10 generations)
-                os.remove(os.path.join(self.backup_dir, old_backup))
+            for backups in by_prefix.values():
+                if len(backups) <= MAX_BACKUPS_PER_FILE:
+                    continue
+                # Keep the newest names without sorting the whole directory
+                keep = set(heapq.nlargest(MAX_BACKUPS_PER_FILE, (e.name for e in backups)))
+                for entry in backups:
+                    if entry.name not in keep:
+                        os.unlink(entry.path)
                 
         except Exception as e:
             logger.error(f"Backup cleanup failed: {e}")
@@ -211,8 +446,9 @@ class PersistentStorage:
     def get_stats(self) -> Dict[str, Any]:
         """Get storage statistics"""
         with self._lock:
-            images = self._read_json_safe(self.images_file, [])
-            generations = self._read_json_safe(self.generations_file, [])
+            images = self._load_images()
+            generation_count = (len(self._read_json_safe(self.generations_file, [])) +
+                                sum(1 for _ in self._read_jsonl(self.generations_log)))
             
             # Count unique users
             unique_users = set()
@@ -222,7 +458,7 @@ class PersistentStorage:
             
             return {
                 'total_images': len(images),
-                'total_generations': len(generations),
+                'total_generations': generation_count,
                 'unique_users': len(unique_users),
                 'storage_healthy': True
             }
@@ -4,14 +4,65 @@ Tracks real user activity and image generation for accurate admin analytics
 """
 
 import os
-import json
+import atexit
+import fcntl
+import hashlib
+import heapq
 import logging
-from datetime import datetime, timedelta
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from operator import itemgetter
+from datetime import date, datetime, timedelta, timezone
 from typing import Dict, List, Any
 from pathlib import Path
+import orjson
 
 logger = logging.getLogger(__name__)
 
+# Record files are rewritten often and stay compact; only platform_stats.json is indented
+JSON_WRITE_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+# Tracked records are queued and written by a background flusher at most every
+# FLUSH_INTERVAL seconds, or sooner once FLUSH_BATCH_SIZE records are waiting.
+# Tracking itself makes no syscalls; a hard crash loses at most the queued records
+FLUSH_INTERVAL = 0.2
+FLUSH_BATCH_SIZE = 64
+
+# Longest active-user window reported by get_platform_stats
+ACTIVE_DAYS_RETAINED = 30
+
+# Seconds a computed get_platform_stats result is reused; any flush invalidates it sooner
+PLATFORM_STATS_CACHE_TTL = 2.0
+
+# Only the most recent records are kept in the tracking files; the cap is platform-wide,
+# so images stay in one file rather than per-user shards
+MAX_TRACKED_IMAGES = 1000
+MAX_TRACKED_ACTIVITIES = 500
+
+# generated_images.json stores one list per field instead of one object per image
+IMAGE_COLUMNS = (
+    'id', 'user_email', 'prompt', 'width', 'height', 'model',
+    'generation_time', 'file_size_mb', 'created_at', 'success'
+)
+
+# Parsed tracking files keyed by path, reused while the file's (inode, mtime_ns, size) is unchanged
+_json_cache = {}
+
+def _fsync_dir(dir_path: Path):
+    """Make renames and newly created files in a directory durable"""
+    try:
+        fd = os.open(dir_path, os.O_RDONLY)
+    except OSError:
+        # Directories cannot be opened for fsync on every platform (e.g. Windows)
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
 class PlatformTracker:
     def __init__(self):
         self.data_dir = Path("data")
@@ -20,9 +71,34 @@ class PlatformTracker:
         self.stats_file = self.data_dir / "platform_stats.json"
         self.activity_file = self.data_dir / "user_activity.json"
         self.images_file = self.data_dir / "generated_images.json"
+        # Every worker process takes this lock before rewriting a tracking file
+        self.lock_file = self.data_dir / "platform_tracking.lock"
+        
+        # Set while a flush batches its directory fsync
+        self._defer_dir_sync = False
         
         # Initialize files if they don't exist
         self._initialize_files()
+        
+        # Pending records; the lock covers draining them and rewriting the files
+        self._pending_images = deque()
+        self._pending_activities = deque()
+        self._stats_dirty = False
+        
+        # Per-user counters and per-day active users as (file signature, value), rebuilt whenever
+        # the images or activity file changes, including writes from other worker processes
+        self._user_stats = None
+        self._active_by_day = None
+        
+        # Last get_platform_stats result as (computed_at, stats)
+        self._stats_cache = None
+        
+        self._lock = threading.RLock()
+        self._flush_event = threading.Event()
+        self._closing = False
+        self._flusher = threading.Thread(target=self._flush_loop, name='platform-tracker-flush', daemon=True)
+        self._flusher.start()
+        atexit.register(self._flush_and_join)
     
     def _initialize_files(self):
         """Initialize tracking files if they don't exist"""
@@ -35,14 +111,16 @@ class PlatformTracker:
                     "created_at": datetime.utcnow().isoformat(),
                     "last_updated": datetime.utcnow().isoformat()
                 }
-                self._save_json(self.stats_file, initial_stats)
+                self._save_json(self.stats_file, initial_stats, pretty=True)
             
             if not self.activity_file.exists():
                 self._save_json(self.activity_file, [])
             
+            # An existing file in the old list-of-objects layout (like the checked-in seed) is left
+            # as is; it is read through _load_image_columns and rewritten as columns on the next flush
             if not self.images_file.exists():
-                self._save_json(self.images_file, [])
-                
+                self._save_json(self.images_file, self._to_image_columns([]))
+            
             logger.info("Platform tracking files initialized")
             
         except Exception as e:
@@ -68,18 +146,11 @@ class PlatformTracker:
                 "success": True
             }
             
-            # Add to images file
-            images = self._load_json(self.images_file)
-            images.append(image_record)
-            
-            # Keep only last 1000 images to prevent file from growing too large
-            if len(images) > 1000:
-                images = images[-1000:]
-            
-            self._save_json(self.images_file, images)
-            
-            # Update platform stats
-            self._update_platform_stats(image_generated=True)
+            # Queue for the images file; the flusher also refreshes the platform stats
+            self._pending_images.append(image_record)
+            self._stats_dirty = True
+            if len(self._pending_images) >= FLUSH_BATCH_SIZE:
+                self._flush_event.set()
             
             # Track user activity
             self.track_user_activity(user_email, "image_generated", {
@@ -99,24 +170,21 @@ class PlatformTracker:
             current_time = datetime.utcnow().replace(tzinfo=timezone.utc)
 
             activity_record = {
-                "id": f"activity_{int(current_time.timestamp())}_{hash(user_email) % 10000}",
+                # Deterministic across processes, unlike hash() which is salted per run
+                "id": f"activity_{int(current_time.timestamp() * 1000)}_{hashlib.blake2b(user_email.encode(), digest_size=4).hexdigest()}",
                 "user_email": user_email,
                 "action": action,
                 "details": details or {},
                 "timestamp": current_time.isoformat(),
+                "ts_epoch": current_time.timestamp(),  # Numeric copy so readers skip ISO parsing
                 "ip_address": "127.0.0.1",  # Would be real IP in production
                 "user_agent": "Web Browser"
             }
             
-            # Add to activity file
-            activities = self._load_json(self.activity_file)
-            activities.append(activity_record)
-            
-            # Keep only last 500 activities
-            if len(activities) > 500:
-                activities = activities[-500:]
-            
-            self._save_json(self.activity_file, activities)
+            # Queue for the activity file
+            self._pending_activities.append(activity_record)
+            if len(self._pending_activities) >= FLUSH_BATCH_SIZE:
+                self._flush_event.set()
             
             logger.debug(f"Tracked activity for {user_email}: {action}")
             
@@ -142,69 +210,54 @@ class PlatformTracker:
     def get_platform_stats(self) -> Dict[str, Any]:
         """Get current platform statistics"""
         try:
-            stats = self._load_json(self.stats_file)
-            images = self._load_json(self.images_file)
-            activities = self._load_json(self.activity_file)
-            
-            # Calculate real-time stats (make timezone-aware)
-            from datetime import timezone
-            current_time = datetime.utcnow().replace(tzinfo=timezone.utc)
-            today = current_time.date()
-            week_ago = current_time - timedelta(days=7)
-            month_ago = current_time - timedelta(days=30)
-            
-            # Count recent activities (handle timezone-aware dates)
-            recent_activities = []
-            week_activities = []
-            month_activities = []
-
-            for a in activities:
-                try:
-                    # Parse timestamp and make it timezone-aware if needed
-                    timestamp_str = a['timestamp']
-                    if timestamp_str.endswith('Z'):
-                        timestamp_str = timestamp_str.replace('Z', '+00:00')
-
-                    activity_time = datetime.fromisoformat(timestamp_str)
-
-                    # Make timezone-aware if naive
-                    if activity_time.tzinfo is None:
-                        activity_time = activity_time.replace(tzinfo=current_time.tzinfo)
-
-                    # Compare dates
-                    if activity_time.date() >= today:
-                        recent_activities.append(a)
-                    if activity_time >= week_ago:
-                        week_activities.append(a)
-                    if activity_time >= month_ago:
-                        month_activities.append(a)
-
-                except Exception as e:
-                    logger.warning(f"Failed to parse activity timestamp {a.get('timestamp')}: {e}")
-                    continue
-            
-            # Get unique users
-            active_users_today = len(set(a['user_email'] for a in recent_activities))
-            active_users_week = len(set(a['user_email'] for a in week_activities))
-            active_users_month = len(set(a['user_email'] for a in month_activities))
-            
-            # Calculate storage
-            total_storage_mb = sum(img.get('file_size_mb', 2.0) for img in images)
-            
-            # Calculate costs (estimate)
-            total_costs = len(images) * 0.02  # $0.02 per image
-            
-            return {
-                'total_users': stats.get('total_users', 1),
-                'total_images_generated': len(images),
-                'total_storage_used_mb': round(total_storage_mb, 2),
-                'active_users_today': max(1, active_users_today),  # At least 1 (admin)
-                'active_users_this_week': max(1, active_users_week),
-                'active_users_this_month': max(1, active_users_month),
-                'total_api_calls': len(activities),
-                'total_costs_usd': round(total_costs, 2),
-                'last_updated': current_time.isoformat()
-            }
+            with self._lock:
+                cached = self._stats_cache
+                if cached is not None and time.monotonic() - cached[0] < PLATFORM_STATS_CACHE_TTL:
+                    return dict(cached[1])
+                
+                stats = self._load_json(self.stats_file)
+                activities = self._load_activities()
+                
+                # Image totals come from the per-user counters rather than the image rows
+                user_stats = self._get_user_stats().values()
+                total_images = sum(user['images_generated'] for user in user_stats)
+                total_storage_mb = sum(user['total_storage_mb'] for user in user_stats)
+                
+                # Union the per-day user buckets for each window; the buckets only cover the
+                # retained activities, so these exact sets stay small
+                current_time = datetime.utcnow().replace(tzinfo=timezone.utc)
+                today = current_time.date()
+                week_start = today - timedelta(days=7)
+                month_start = today - timedelta(days=ACTIVE_DAYS_RETAINED)
+                users_today, users_week, users_month = set(), set(), set()
+                for day, users in self._get_active_by_day().items():
+                    if day >= month_start:
+                        users_month.update(users)
+                        if day >= week_start:
+                            users_week.update(users)
+                            if day >= today:
+                                users_today.update(users)
+                
+                active_users_today = len(users_today)
+                active_users_week = len(users_week)
+                active_users_month = len(users_month)
+                
+                # Calculate costs (estimate)
+                total_costs = total_images * 0.02  # $0.02 per image
+                
+                platform_stats = {
+                    'total_users': stats.get('total_users', 1),
+                    'total_images_generated': total_images,
+                    'total_storage_used_mb': round(total_storage_mb, 2),
+                    'active_users_today': max(1, active_users_today),  # At least 1 (admin)
+                    'active_users_this_week': max(1, active_users_week),
+                    'active_users_this_month': max(1, active_users_month),
+                    'total_api_calls': len(activities),
+                    'total_costs_usd': round(total_costs, 2),
+                    'last_updated': current_time.isoformat()
+                }
+                self._stats_cache = (time.monotonic(), platform_stats)
+            return dict(platform_stats)
             
         except Exception as e:
             logger.error(f"Failed to get platform stats: {e}")
@@ -223,16 +276,11 @@ class PlatformTracker:
     def get_recent_activity(self, limit: int = 10) -> List[Dict[str, Any]]:
         """Get recent user activity"""
         try:
-            activities = self._load_json(self.activity_file)
-            
-            # Sort by timestamp (newest first) and limit
-            sorted_activities = sorted(
-                activities, 
-                key=lambda x: x['timestamp'], 
-                reverse=True
-            )[:limit]
+            with self._lock:
+                activities = self._load_activities()
             
-            return sorted_activities
+            # Newest first, limited; only the top entries are ordered
+            return heapq.nlargest(limit, activities, key=itemgetter('timestamp'))
             
         except Exception as e:
             logger.error(f"Failed to get recent activity: {e}")
@@ -241,36 +289,14 @@ class PlatformTracker:
     def get_top_users(self, limit: int = 10) -> List[Dict[str, Any]]:
         """Get top users by activity"""
         try:
-            images = self._load_json(self.images_file)
-            activities = self._load_json(self.activity_file)
-            
-            # Count images per user
-            user_stats = {}
-            for img in images:
-                user_email = img.get('user_email', 'unknown')
-                if user_email not in user_stats:
-                    user_stats[user_email] = {
-                        'email': user_email,
-                        'images_generated': 0,
-                        'total_storage_mb': 0.0,
-                        'last_active': img['created_at'],
-                        'join_date': img['created_at'],  # First image as join proxy
-                        'subscription': 'admin' if user_email == 'srikarboina9999@gmail.com' else 'free'
-                    }
-                
-                user_stats[user_email]['images_generated'] += 1
-                user_stats[user_email]['total_storage_mb'] += img.get('file_size_mb', 2.0)
-                
-                # Update last active
-                if img['created_at'] > user_stats[user_email]['last_active']:
-                    user_stats[user_email]['last_active'] = img['created_at']
-            
-            # Sort by images generated
-            top_users = sorted(
-                user_stats.values(),
-                key=lambda x: x['images_generated'],
-                reverse=True
-            )[:limit]
+            with self._lock:
+                # Rank the maintained per-user counters instead of rescanning images
+                top_users = heapq.nlargest(
+                    limit,
+                    self._get_user_stats().values(),
+                    key=itemgetter('images_generated')
+                )
+                top_users = [dict(user) for user in top_users]
             
             # Round storage values
             for user in top_users:
@@ -285,36 +311,243 @@ class PlatformTracker:
     def _update_platform_stats(self, new_user: bool = False, image_generated: bool = False):
         """Update platform statistics"""
         try:
-            stats = self._load_json(self.stats_file)
-            
-            if new_user:
-                stats['total_users'] = stats.get('total_users', 0) + 1
-            
-            stats['last_updated'] = datetime.utcnow().isoformat()
-            
-            self._save_json(self.stats_file, stats)
+            with self._lock, self._tracking_file_lock():
+                stats = self._load_json(self.stats_file, fresh=True)
+                
+                if new_user:
+                    stats['total_users'] = stats.get('total_users', 0) + 1
+                
+                stats['last_updated'] = datetime.utcnow().isoformat()
+                
+                self._save_json(self.stats_file, stats, pretty=True)
+                self._stats_cache = None
             
         except Exception as e:
             logger.error(f"Failed to update platform stats: {e}")
     
-    def _load_json(self, file_path: Path) -> Any:
-        """Load JSON data from file"""
+    def _get_user_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-user counters over the stored images, rebuilt when the images file changes; the caller holds the lock"""
+        signature = self._file_signature(self.images_file)
+        if self._user_stats is None or self._user_stats[0] != signature:
+            user_stats = {}
+            for img in self._image_rows(self._load_image_columns()):
+                self._count_user_image(user_stats, img)
+            self._user_stats = (signature, user_stats)
+        return self._user_stats[1]
+    
+    @staticmethod
+    def _count_user_image(user_stats: Dict[str, Dict[str, Any]], img: Dict[str, Any]):
+        """Add one image to its user's counters; legacy rows without created_at are skipped"""
+        created_at = img.get('created_at')
+        if created_at is None:
+            return
+        
+        user_email = img.get('user_email', 'unknown')
+        user = user_stats.get(user_email)
+        
+        if user is None:
+            user = user_stats[user_email] = {
+                'email': user_email,
+                'images_generated': 0,
+                'total_storage_mb': 0.0,
+                'last_active': created_at,
+                'join_date': created_at,  # First image as join proxy
+                'subscription': 'admin' if user_email == 'srikarboina9999@gmail.com' else 'free'
+            }
+        
+        user['images_generated'] += 1
+        user['total_storage_mb'] += img.get('file_size_mb', 2.0)
+        
+        # Update last active
+        if created_at > user['last_active']:
+            user['last_active'] = created_at
+    
+    @staticmethod
+    def _activity_day(activity: Dict[str, Any]) -> date:
+        """Calendar day of an activity's timestamp"""
+        ts_epoch = activity.get('ts_epoch')
+        if ts_epoch is not None:
+            return datetime.fromtimestamp(ts_epoch, timezone.utc).date()
+        
+        # Records written before ts_epoch existed
+        timestamp_str = activity['timestamp']
+        if timestamp_str.endswith('Z'):
+            timestamp_str = timestamp_str.replace('Z', '+00:00')
+        return datetime.fromisoformat(timestamp_str).date()
+    
+    def _get_active_by_day(self) -> Dict[date, set]:
+        """Users active on each day of the stored activities, rebuilt when the activity file changes; the caller holds the lock"""
+        signature = self._file_signature(self.activity_file)
+        if self._active_by_day is None or self._active_by_day[0] != signature:
+            active_by_day = {}
+            for activity in self._load_json(self.activity_file):
+                try:
+                    active_by_day.setdefault(self._activity_day(activity), set()).add(activity['user_email'])
+                except Exception as e:
+                    logger.warning(f"Failed to parse activity timestamp {activity.get('timestamp')}: {e}")
+            self._active_by_day = (signature, active_by_day)
+        return self._active_by_day[1]
+    
+    @staticmethod
+    def _to_image_columns(images: List[Dict[str, Any]]) -> Dict[str, List[Any]]:
+        """Turn image records into the per-field lists stored in the images file"""
+        return {name: [img.get(name) for img in images] for name in IMAGE_COLUMNS}
+    
+    def _load_image_columns(self, fresh: bool = False) -> Dict[str, List[Any]]:
+        """Stored images as per-field lists, converting the old layout if found"""
+        images = self._load_json(self.images_file, fresh)
+        if isinstance(images, list):
+            return self._to_image_columns(images)
+        return {name: images.get(name) or [] for name in IMAGE_COLUMNS}
+    
+    @staticmethod
+    def _image_rows(columns: Dict[str, List[Any]], stop: int = None):
+        """Yield the counter fields of the first `stop` images (all by default) as small dicts"""
+        fields = ('user_email', 'file_size_mb', 'created_at')
+        for values in zip(*(columns[name][:stop] for name in fields)):
+            # Missing values fall back to the counters' defaults
+            yield {name: value for name, value in zip(fields, values) if value is not None}
+    
+    def _load_activities(self) -> List[Dict[str, Any]]:
+        """Stored activities plus queued ones; the caller holds the lock"""
+        activities = self._load_json(self.activity_file)
+        activities.extend(self._pending_activities)
+        return activities[-MAX_TRACKED_ACTIVITIES:]
+    
+    @staticmethod
+    def _drain(pending: deque) -> List[Dict[str, Any]]:
+        """Pop every queued record; appends from other threads are never lost"""
+        records = []
+        while pending:
+            records.append(pending.popleft())
+        return records
+    
+    def _flush(self):
+        """Write queued records with one rewrite per tracking file"""
+        with self._lock:
+            # Every file written in this window shares one directory fsync
+            self._defer_dir_sync = True
+            try:
+                written = self._flush_pending()
+            finally:
+                self._defer_dir_sync = False
+            if written:
+                _fsync_dir(self.data_dir)
+    
+    def _flush_pending(self):
+        """Drain the queues into the tracking files and report whether anything was written; the caller holds the lock"""
+        images = self._drain(self._pending_images)
+        activities = self._drain(self._pending_activities)
+        
+        if images or activities:
+            # Re-read from disk under the cross-process lock so records other workers wrote are kept.
+            # The signature cache can't be trusted here: mtime has clock-tick resolution and a
+            # replaced file may reuse the inode, so another worker's same-size rewrite can go unseen
+            with self._tracking_file_lock():
+                if images:
+                    # The cached columns are shared, so each one is rebuilt rather than extended
+                    columns = self._load_image_columns(fresh=True)
+                    added = self._to_image_columns(images)
+                    columns = {name: (columns[name] + added[name])[-MAX_TRACKED_IMAGES:] for name in IMAGE_COLUMNS}
+                    self._save_json(self.images_file, columns)
+                
+                if activities:
+                    stored = self._load_json(self.activity_file, fresh=True)
+                    stored.extend(activities)
+                    self._save_json(self.activity_file, stored[-MAX_TRACKED_ACTIVITIES:])
+        
+        stats_dirty = self._stats_dirty
+        if stats_dirty:
+            self._stats_dirty = False
+            self._update_platform_stats(image_generated=True)
+        
+        written = bool(images or activities or stats_dirty)
+        if written:
+            self._stats_cache = None
+        return written
+    
+    def _flush_loop(self):
+        """Background flusher: wake every FLUSH_INTERVAL or when a batch fills up"""
+        while True:
+            self._flush_event.wait(FLUSH_INTERVAL)
+            self._flush_event.clear()
+            # Read before flushing: records queued during a flush already in progress at shutdown
+            # get one more pass
+            closing = self._closing
+            try:
+                self._flush()
+            except Exception as e:
+                logger.error(f"Failed to flush tracking data: {e}")
+            if closing:
+                return
+    
+    def _flush_and_join(self):
+        """Write anything still queued before the process exits"""
+        self._closing = True
+        self._flush_event.set()
+        self._flusher.join(timeout=5)
+    
+    @contextmanager
+    def _tracking_file_lock(self):
+        """Hold the exclusive lock every process takes before rewriting a tracking file"""
+        # The tracking files are replaced on every write, so the lock lives on a sidecar
+        with open(self.lock_file, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    
+    @staticmethod
+    def _file_signature(file_path: Path):
+        """(inode, mtime_ns, size) of a file, or None if it does not exist"""
+        try:
+            stat = file_path.stat()
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    
+    def _load_json(self, file_path: Path, fresh: bool = False) -> Any:
+        """Load JSON data from file; fresh=True skips the parsed-file cache"""
         try:
-            if file_path.exists():
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+            signature = self._file_signature(file_path)
+            if signature is not None:
+                cache_key = str(file_path)
+                cached = _json_cache.get(cache_key)
+                if fresh or cached is None or cached[0] != signature:
+                    with open(file_path, 'rb') as f:
+                        cached = (signature, orjson.loads(f.read()))
+                    _json_cache[cache_key] = cached
+                # Callers append to or update the top-level container before saving it back
+                data = cached[1]
+                return list(data) if type(data) is list else dict(data) if type(data) is dict else data
             return [] if 'activity' in str(file_path) or 'images' in str(file_path) else {}
         except Exception as e:
             logger.error(f"Failed to load {file_path}: {e}")
             return [] if 'activity' in str(file_path) or 'images' in str(file_path) else {}
     
-    def _save_json(self, file_path: Path, data: Any):
+    def _save_json(self, file_path: Path, data: Any, pretty: bool = False):
         """Save JSON data to file"""
+        options = JSON_WRITE_OPTIONS | orjson.OPT_INDENT_2 if pretty else JSON_WRITE_OPTIONS
+        # A unique temp file per write, so concurrent writers never replace each other's partial file
+        fd, temp_path = tempfile.mkstemp(dir=self.data_dir, prefix=f".{file_path.name}.", suffix='.tmp')
         try:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(orjson.dumps(data, option=options))
+                f.flush()
+                os.fsync(f.fileno())
+            
+            # Replace atomically so a crash never leaves a half-written file
+            _json_cache.pop(str(file_path), None)
+            os.replace(temp_path, file_path)
+            if not self._defer_dir_sync:
+                _fsync_dir(self.data_dir)
         except Exception as e:
             logger.error(f"Failed to save {file_path}: {e}")
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
 
 # Global instance
 platform_tracker = PlatformTracker()
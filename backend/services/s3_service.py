@@ -1,33 +1,93 @@
 import boto3
+from boto3.s3.transfer import TransferConfig
 from botocore.exceptions import ClientError, NoCredentialsError
+from concurrent.futures import ThreadPoolExecutor
 from flask import current_app
 import logging
+import threading
 from datetime import datetime, timedelta
 import io
+from operator import itemgetter
 from PIL import Image
 
 logger = logging.getLogger(__name__)
 
+# Objects above the threshold are split into parts and uploaded concurrently (create/upload
+# part/complete, aborted on failure); smaller images still go up as a single PUT.
+IMAGE_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=4 * 1024 * 1024,
+    multipart_chunksize=8 * 1024 * 1024,
+    max_concurrency=8,
+    use_threads=True
+)
+
+# boto3 clients shared across requests, keyed by credentials and region
+_clients = {}
+_clients_lock = threading.Lock()
+
+# Buckets whose head_bucket check already passed in this process
+_verified_buckets = set()
+
+def _get_s3_client(access_key_id, secret_access_key, region):
+    """Return the process-wide S3 client for these credentials"""
+    cache_key = (access_key_id, secret_access_key, region)
+    client = _clients.get(cache_key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(cache_key)
+            if client is None:
+                client = boto3.client(
+                    's3',
+                    aws_access_key_id=access_key_id,
+                    aws_secret_access_key=secret_access_key,
+                    region_name=region
+                )
+                _clients[cache_key] = client
+    return client
+
+# Runs the full-size upload while the caller builds and uploads the thumbnail
+_upload_executor = ThreadPoolExecutor(max_workers=4)
+
+_object_size = itemgetter('Size')
+
+def _thumbnail_filename(filename):
+    """Name of the thumbnail object stored for an image"""
+    return f"{filename.rsplit('.', 1)[0]}_thumb.jpg"
+
 class S3Service:
     """Service for handling AWS S3 operations"""
     
+    # Key prefixes for full-size images and thumbnails
+    IMAGE_PREFIX = 'images/'
+    THUMBNAIL_PREFIX = 'thumbnails/'
+    
+    # Uploaded objects are public and cached for a year
+    _PUBLIC_OBJECT_ARGS = {
+        'CacheControl': 'max-age=31536000',
+        'ACL': 'public-read'
+    }
+    
     def __init__(self):
-        self.bucket_name = current_app.config.get('S3_BUCKET_NAME')
-        self.region = current_app.config.get('S3_BUCKET_REGION', 'us-east-1')
+        config = current_app.config
+        self.bucket_name = config.get('S3_BUCKET_NAME')
+        self.region = config.get('S3_BUCKET_REGION', 'us-east-1')
+        self._base_url = f"https://{self.bucket_name}.s3.{self.region}.amazonaws.com/"
         
         if not self.bucket_name:
             raise ValueError("S3_BUCKET_NAME is required")
         
         try:
-            self.s3_client = boto3.client(
-                's3',
-                aws_access_key_id=current_app.config.get('AWS_ACCESS_KEY_ID'),
-                aws_secret_access_key=current_app.config.get('AWS_SECRET_ACCESS_KEY'),
-                region_name=self.region
+            self.s3_client = _get_s3_client(
+                config.get('AWS_ACCESS_KEY_ID'),
+                config.get('AWS_SECRET_ACCESS_KEY'),
+                self.region
             )
             
-            # Test connection
-            self.s3_client.head_bucket(Bucket=self.bucket_name)
+            # Test connection once per client and bucket
+            verified_key = (id(self.s3_client), self.bucket_name)
+            if verified_key not in _verified_buckets:
+                self.s3_client.head_bucket(Bucket=self.bucket_name)
+                _verified_buckets.add(verified_key)
             
         except NoCredentialsError:
             logger.error("AWS credentials not found")
@@ -44,23 +104,27 @@ class S3Service:
     def upload_image(self, image_data, filename, content_type='image/png'):
         """Upload image to S3"""
         try:
-            # Create file-like object from image data
-            image_file = io.BytesIO(image_data)
+            extra_args = {**self._PUBLIC_OBJECT_ARGS, 'ContentType': content_type}
             
-            # Upload to S3
-            self.s3_client.upload_fileobj(
-                image_file,
-                self.bucket_name,
-                f"images/{filename}",
-                ExtraArgs={
-                    'ContentType': content_type,
-                    'CacheControl': 'max-age=31536000',  # 1 year cache
-                    'ACL': 'public-read'  # Make images publicly readable
-                }
-            )
+            # Upload to S3; below the multipart threshold the bytes go up in one PUT without chunked reads
+            if len(image_data) < IMAGE_TRANSFER_CONFIG.multipart_threshold:
+                self.s3_client.put_object(
+                    Bucket=self.bucket_name,
+                    Key=self.IMAGE_PREFIX + filename,
+                    Body=image_data,
+                    **extra_args
+                )
+            else:
+                self.s3_client.upload_fileobj(
+                    io.BytesIO(image_data),
+                    self.bucket_name,
+                    self.IMAGE_PREFIX + filename,
+                    ExtraArgs=extra_args,
+                    Config=IMAGE_TRANSFER_CONFIG
+                )
             
             # Generate public URL
-            url = f"https://{self.bucket_name}.s3.{self.region}.amazonaws.com/images/{filename}"
+            url = self._base_url + self.IMAGE_PREFIX + filename
             
             logger.info(f"Image uploaded successfully: {filename}")
             
@@ -85,13 +149,24 @@ class S3Service:
             }
     
     def delete_image(self, filename):
-        """Delete image from S3"""
+        """Delete image and its thumbnail from S3"""
         try:
-            self.s3_client.delete_object(
+            # One request for both objects; a missing thumbnail is not an error
+            response = self.s3_client.delete_objects(
                 Bucket=self.bucket_name,
-                Key=f"images/{filename}"
+                Delete={
+                    'Objects': [
+                        {'Key': self.IMAGE_PREFIX + filename},
+                        {'Key': self.THUMBNAIL_PREFIX + _thumbnail_filename(filename)}
+                    ],
+                    'Quiet': True
+                }
             )
             
+            if response.get('Errors'):
+                logger.error(f"S3 delete error: {response['Errors']}")
+                return False
+            
             logger.info(f"Image deleted successfully: {filename}")
             return True
             
@@ -105,11 +180,12 @@ class S3Service:
     def generate_download_url(self, filename, expiration=3600):
         """Generate presigned URL for downloading image"""
         try:
+            # Signed locally by botocore (about 0.2 ms, no request), including role session tokens
             url = self.s3_client.generate_presigned_url(
                 'get_object',
                 Params={
                     'Bucket': self.bucket_name,
-                    'Key': f"images/{filename}",
+                    'Key': self.IMAGE_PREFIX + filename,
                     'ResponseContentDisposition': f'attachment; filename="{filename}"'
                 },
                 ExpiresIn=expiration
@@ -127,43 +203,47 @@ class S3Service:
     def upload_thumbnail(self, image_data, filename, max_size=(300, 300)):
         """Upload thumbnail version of image"""
         try:
-            # Create thumbnail
+            # Opening only parses the header
             image = Image.open(io.BytesIO(image_data))
-            image.thumbnail(max_size, Image.Resampling.LANCZOS)
             
-            # Convert to RGB if necessary
-            if image.mode in ('RGBA', 'LA', 'P'):
-                background = Image.new('RGB', image.size, (255, 255, 255))
+            if image.format == 'JPEG' and image.width <= max_size[0] and image.height <= max_size[1]:
+                # Already a small JPEG; upload it as is
+                thumbnail_data = image_data
+            else:
+                # Create thumbnail; JPEGs are decoded straight to RGB at a reduced DCT scale
+                # (shrink-on-load), so the full-resolution bitmap is never built
+                image.draft('RGB', max_size)
+                image.thumbnail(max_size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+                
+                # Convert to RGB if necessary; RGB sources (typical FLUX output) are saved as is
                 if image.mode == 'P':
-                    image = image.convert('RGBA')
-                background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
-                image = background
-            
-            # Save thumbnail to bytes
-            thumbnail_io = io.BytesIO()
-            image.save(thumbnail_io, format='JPEG', quality=85, optimize=True)
-            thumbnail_data = thumbnail_io.getvalue()
+                    # Only palettes with a transparent entry need compositing
+                    image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+                if image.mode in ('RGBA', 'LA'):
+                    background = Image.new('RGB', image.size, (255, 255, 255))
+                    background.paste(image, mask=image.getchannel('A'))
+                    image = background
+                
+                # Save thumbnail to bytes
+                thumbnail_io = io.BytesIO()
+                image.save(thumbnail_io, format='JPEG', quality=85, optimize=True)
+                thumbnail_data = thumbnail_io.getvalue()
             
             # Generate thumbnail filename
-            name, ext = filename.rsplit('.', 1)
-            thumbnail_filename = f"{name}_thumb.jpg"
+            thumbnail_filename = _thumbnail_filename(filename)
             
             # Upload thumbnail
-            thumbnail_file = io.BytesIO(thumbnail_data)
-            
-            self.s3_client.upload_fileobj(
-                thumbnail_file,
-                self.bucket_name,
-                f"thumbnails/{thumbnail_filename}",
-                ExtraArgs={
-                    'ContentType': 'image/jpeg',
-                    'CacheControl': 'max-age=31536000',
-                    'ACL': 'public-read'
-                }
+            # Thumbnails are always small enough for a single PUT
+            self.s3_client.put_object(
+                Bucket=self.bucket_name,
+                Key=self.THUMBNAIL_PREFIX + thumbnail_filename,
+                Body=thumbnail_data,
+                ContentType='image/jpeg',
+                **self._PUBLIC_OBJECT_ARGS
             )
             
             # Generate thumbnail URL
-            thumbnail_url = f"https://{self.bucket_name}.s3.{self.region}.amazonaws.com/thumbnails/{thumbnail_filename}"
+            thumbnail_url = self._base_url + self.THUMBNAIL_PREFIX + thumbnail_filename
             
             logger.info(f"Thumbnail uploaded successfully: {thumbnail_filename}")
             
@@ -181,6 +261,25 @@ class S3Service:
                 'error': f"Thumbnail upload failed: {str(e)}"
             }
     
+    def upload_image_and_thumbnail(self, image_data, filename, content_type='image/png'):
+        """Upload image and its thumbnail concurrently; 'thumbnail_url' is set when the thumbnail succeeded"""
+        image_future = _upload_executor.submit(self.upload_image, image_data, filename, content_type)
+        thumbnail_result = self.upload_thumbnail(image_data, filename)
+        upload_result = image_future.result()
+        
+        if thumbnail_result['success']:
+            if upload_result['success']:
+                upload_result['thumbnail_url'] = thumbnail_result['url']
+            else:
+                # Don't leave a thumbnail behind for an image that was never stored; a failed cleanup
+                # must not replace the upload error returned below
+                try:
+                    self.s3_client.delete_object(Bucket=self.bucket_name, Key=self.THUMBNAIL_PREFIX + thumbnail_result['filename'])
+                except ClientError as e:
+                    logger.error(f"Orphaned thumbnail cleanup failed: {str(e)}")
+        
+        return upload_result
+    
     def check_bucket_exists(self):
         """Check if S3 bucket exists and is accessible"""
         try:
@@ -199,14 +298,14 @@ class S3Service:
                     "Effect": "Allow",
                     "Principal": "*",
                     "Action": "s3:GetObject",
-                    "Resource": f"arn:aws:s3:::{self.bucket_name}/images/*"
+                    "Resource": f"arn:aws:s3:::{self.bucket_name}/{self.IMAGE_PREFIX}*"
                 },
                 {
                     "Sid": "PublicReadGetThumbnail",
                     "Effect": "Allow",
                     "Principal": "*",
                     "Action": "s3:GetObject",
-                    "Resource": f"arn:aws:s3:::{self.bucket_name}/thumbnails/*"
+                    "Resource": f"arn:aws:s3:::{self.bucket_name}/{self.THUMBNAIL_PREFIX}*"
                 }
             ]
         }
@@ -239,7 +338,7 @@ class S3Service:
     def get_storage_usage(self, user_id=None):
         """Get storage usage statistics"""
         try:
-            prefix = f"images/{user_id}_" if user_id else "images/"
+            prefix = f"{self.IMAGE_PREFIX}{user_id}_" if user_id else self.IMAGE_PREFIX
             
             paginator = self.s3_client.get_paginator('list_objects_v2')
             pages = paginator.paginate(Bucket=self.bucket_name, Prefix=prefix)
@@ -247,11 +346,12 @@ class S3Service:
             total_size = 0
             object_count = 0
             
+            # Sum each page at C speed; KeyCount saves counting the entries
             for page in pages:
-                if 'Contents' in page:
-                    for obj in page['Contents']:
-                        total_size += obj['Size']
-                        object_count += 1
+                contents = page.get('Contents')
+                if contents:
+                    total_size += sum(map(_object_size, contents))
+                    object_count += page.get('KeyCount', len(contents))
             
             return {
                 'total_size_bytes': total_size,
@@ -5,13 +5,146 @@ Tracks daily usage limits for authenticated and non-authenticated users
 
 import logging
 from datetime import datetime, timezone, timedelta
+from contextlib import contextmanager
 from typing import Dict, Optional, Tuple
-from flask import current_app
-import json
+from flask import current_app, has_app_context
+import atexit
+import fcntl
 import os
+import tempfile
+import threading
+import time
+import orjson
+import redis
 
 logger = logging.getLogger(__name__)
 
+# Redis counters live for a day past their first increment; the date in the key scopes them
+USAGE_KEY_TTL = 86400
+
+# Counts one use only while the counter is below the limit (ARGV[1]), in a single round trip,
+# so concurrent workers can never push a counter past its limit
+INCREMENT_IF_BELOW_LIMIT = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+if current >= tonumber(ARGV[1]) then
+    return {0, current}
+end
+current = redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return {1, current}
+"""
+
+# Redis clients and their registered increment scripts, shared across requests and keyed by URL
+_redis_clients = {}
+_increment_scripts = {}
+_redis_clients_lock = threading.Lock()
+
+def _get_redis_client(url):
+    """Return the process-wide Redis client for a URL"""
+    client = _redis_clients.get(url)
+    if client is None:
+        with _redis_clients_lock:
+            client = _redis_clients.get(url)
+            if client is None:
+                client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+                # Invoked by SHA with EVALSHA; redis-py reloads the script if the server lost it
+                _increment_scripts[url] = client.register_script(INCREMENT_IF_BELOW_LIMIT)
+                _redis_clients[url] = client
+    return client
+
+# Without Redis the counters live in memory, keyed by usage file path. Each process also keeps
+# the increments it has not yet written; every USAGE_FLUSH_INTERVAL seconds a background thread
+# takes an flock on the file's .lock sidecar, adds those increments to the counts on disk and
+# reloads the merged file, so every gunicorn worker enforces the same limits. Between syncs a
+# worker may not see the others' latest increments, and a crash loses at most one interval of its own
+USAGE_FLUSH_INTERVAL = 5.0
+_usage_data = {}
+_usage_pending = {}  # usage file -> {date: {usage key: increments not yet on disk}}
+_usage_lock = threading.RLock()
+_usage_flusher = None
+
+def _cleanup_old_data(data: Dict):
+    """Remove usage data older than 7 days, in place"""
+    cutoff_key = (datetime.now(timezone.utc) - timedelta(days=7)).strftime('%Y-%m-%d')
+    for date_key in [date_key for date_key in data if date_key < cutoff_key]:
+        del data[date_key]
+
+def _read_usage_file(usage_file: str) -> Dict:
+    """Read a usage file, dropping old days; a missing or corrupt file reads as empty"""
+    try:
+        with open(usage_file, 'rb') as f:
+            data = orjson.loads(f.read())
+    except (FileNotFoundError, orjson.JSONDecodeError):
+        data = {}
+    _cleanup_old_data(data)
+    return data
+
+def _write_usage_file(usage_file: str, data: Dict):
+    """Atomically replace a usage file"""
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(usage_file) or '.', prefix='.tmp-', suffix='.json')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(orjson.dumps(data))
+        os.replace(temp_path, usage_file)
+    except Exception as e:
+        logger.error(f"Failed to save usage data: {str(e)}")
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
+@contextmanager
+def _usage_file_lock(usage_file: str):
+    """Hold the exclusive lock every process takes before rewriting a usage file"""
+    # The data file itself is replaced on every write, so the lock lives on a sidecar
+    with open(usage_file + '.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _sync_usage_file(usage_file: str, reset: Optional[Tuple[str, str]] = None):
+    """Merge pending increments into a usage file, dropping the reset (date, usage key) counter, and reload it; the caller holds _usage_lock"""
+    pending = _usage_pending.pop(usage_file, None)
+    with _usage_file_lock(usage_file):
+        data = _read_usage_file(usage_file)
+        if pending:
+            for date_key, counts in pending.items():
+                day = data.setdefault(date_key, {})
+                for usage_key, count in counts.items():
+                    day[usage_key] = day.get(usage_key, 0) + count
+        if reset is not None:
+            data.get(reset[0], {}).pop(reset[1], None)
+        if pending or reset is not None:
+            _write_usage_file(usage_file, data)
+    _usage_data[usage_file] = data
+
+def _flush_usage_files():
+    """Write pending increments and pick up other processes' counts for every loaded usage file"""
+    with _usage_lock:
+        for usage_file in list(_usage_data):
+            if usage_file not in _usage_pending and not os.path.exists(usage_file):
+                continue
+            try:
+                _sync_usage_file(usage_file)
+            except OSError as e:
+                logger.error(f"Failed to sync usage data: {str(e)}")
+
+def _usage_flush_loop():
+    """Background writer for in-memory usage counters"""
+    while True:
+        time.sleep(USAGE_FLUSH_INTERVAL)
+        _flush_usage_files()
+
+def _start_usage_flusher():
+    """Start the background writer once per process"""
+    global _usage_flusher
+    if _usage_flusher is None:
+        _usage_flusher = threading.Thread(target=_usage_flush_loop, name='usage-flush', daemon=True)
+        _usage_flusher.start()
+        atexit.register(_flush_usage_files)
+
 class UsageTracker:
     """
     Tracks usage limits for image generation
@@ -25,44 +158,51 @@ class UsageTracker:
             'anonymous': 1,  # 1 image per IP per day
             'authenticated': 5  # 5 images per email per day
         }
+        
+        # Counters go to Redis when it is configured; the JSON file is the fallback
+        redis_url = current_app.config.get('USAGE_REDIS_URL') if has_app_context() else None
+        self._redis = _get_redis_client(redis_url) if redis_url else None
+        self._increment_script = _increment_scripts.get(redis_url)
+        
         self._ensure_usage_file()
     
     def _ensure_usage_file(self):
         """Ensure usage file exists"""
-        if not os.path.exists(self.usage_file):
-            self._save_usage_data({})
+        if self.usage_file not in _usage_data and not os.path.exists(self.usage_file):
+            with _usage_file_lock(self.usage_file):
+                if not os.path.exists(self.usage_file):
+                    _write_usage_file(self.usage_file, {})
     
     def _load_usage_data(self) -> Dict:
-        """Load usage data from file"""
-        try:
-            with open(self.usage_file, 'r') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return {}
+        """In-memory usage data for this file, read from disk on first use; the caller holds _usage_lock"""
+        data = _usage_data.get(self.usage_file)
+        if data is None:
+            data = _usage_data[self.usage_file] = _read_usage_file(self.usage_file)
+            _start_usage_flusher()
+        return data
     
-    def _save_usage_data(self, data: Dict):
-        """Save usage data to file"""
-        try:
-            with open(self.usage_file, 'w') as f:
-                json.dump(data, f, indent=2)
-        except Exception as e:
-            logger.error(f"Failed to save usage data: {str(e)}")
+    def _record_increment(self, date_key: str, subject_key: str):
+        """Queue one increment for the background writer; the caller holds _usage_lock"""
+        pending_day = _usage_pending.setdefault(self.usage_file, {}).setdefault(date_key, {})
+        pending_day[subject_key] = pending_day.get(subject_key, 0) + 1
+    
+    def flush(self):
+        """Write pending usage counters to disk now"""
+        _flush_usage_files()
     
     def _get_today_key(self) -> str:
         """Get today's date key for usage tracking"""
         return datetime.now(timezone.utc).strftime('%Y-%m-%d')
     
-    def _cleanup_old_data(self, data: Dict) -> Dict:
-        """Remove usage data older than 7 days"""
-        cutoff_date = datetime.now(timezone.utc) - timedelta(days=7)
-        cutoff_key = cutoff_date.strftime('%Y-%m-%d')
-        
-        cleaned_data = {}
-        for date_key, date_data in data.items():
-            if date_key >= cutoff_key:
-                cleaned_data[date_key] = date_data
-        
-        return cleaned_data
+    def _subject(self, user_id: Optional[str], ip_address: Optional[str]) -> Tuple[str, int]:
+        """Usage key and daily limit for a user, or for an IP when anonymous"""
+        if user_id:
+            return f"user:{user_id}", self.limits['authenticated']
+        return f"ip:{ip_address}", self.limits['anonymous']
+    
+    def _redis_key(self, subject_key: str) -> str:
+        """Redis key of today's counter for a usage key"""
+        return f"usage:{self._get_today_key()}:{subject_key}"
     
     def check_usage_limit(self, user_id: Optional[str] = None, ip_address: Optional[str] = None) -> Tuple[bool, int, int]:
         """
@@ -75,25 +215,18 @@ class UsageTracker:
         Returns:
             Tuple of (can_generate, current_usage, limit)
         """
-        data = self._load_usage_data()
-        today_key = self._get_today_key()
-        
-        # Clean up old data
-        data = self._cleanup_old_data(data)
-        
-        # Get today's data
-        today_data = data.get(today_key, {})
+        if self._redis is not None:
+            subject_key, limit = self._subject(user_id, ip_address)
+            try:
+                current_usage = int(self._redis.get(self._redis_key(subject_key)) or 0)
+                return current_usage < limit, current_usage, limit
+            except redis.RedisError as e:
+                logger.error(f"Redis usage check failed, using file storage: {str(e)}")
         
-        if user_id:
-            # Authenticated user
-            user_key = f"user:{user_id}"
-            current_usage = today_data.get(user_key, 0)
-            limit = self.limits['authenticated']
-        else:
-            # Non-authenticated user (use IP)
-            ip_key = f"ip:{ip_address}"
-            current_usage = today_data.get(ip_key, 0)
-            limit = self.limits['anonymous']
+        subject_key, limit = self._subject(user_id, ip_address)
+        with _usage_lock:
+            today_data = self._load_usage_data().get(self._get_today_key(), {})
+            current_usage = today_data.get(subject_key, 0)
         
         can_generate = current_usage < limit
         
@@ -102,57 +235,61 @@ class UsageTracker:
         
         return can_generate, current_usage, limit
     
-    def increment_usage(self, user_id: Optional[str] = None, ip_address: Optional[str] = None) -> bool:
+    def check_and_increment(self, user_id: Optional[str] = None, ip_address: Optional[str] = None) -> Tuple[bool, int, int]:
         """
-        Increment usage count for user/IP
+        Atomically check the limit and count one generation if it allows it
         
         Args:
             user_id: User ID for authenticated users
             ip_address: IP address for non-authenticated users
             
         Returns:
-            True if increment was successful, False if limit would be exceeded
+            Tuple of (incremented, current_usage, limit), with current_usage after any increment
         """
-        data = self._load_usage_data()
-        today_key = self._get_today_key()
-        
-        # Clean up old data
-        data = self._cleanup_old_data(data)
+        subject_key, limit = self._subject(user_id, ip_address)
         
-        # Get today's data
-        if today_key not in data:
-            data[today_key] = {}
-        
-        today_data = data[today_key]
+        if self._redis is not None:
+            try:
+                incremented, new_count = self._increment_script(
+                    keys=[self._redis_key(subject_key)], args=[limit, USAGE_KEY_TTL]
+                )
+                if not incremented:
+                    return False, new_count, limit
+                
+                logger.info(f"Usage incremented - User: {user_id or 'anonymous'}, IP: {ip_address}, "
+                           f"New count: {new_count}")
+                return True, new_count, limit
+            except redis.RedisError as e:
+                logger.error(f"Redis usage increment failed, using file storage: {str(e)}")
         
-        if user_id:
-            # Authenticated user
-            user_key = f"user:{user_id}"
-            current_usage = today_data.get(user_key, 0)
-            limit = self.limits['authenticated']
-            
-            if current_usage >= limit:
-                return False
-            
-            today_data[user_key] = current_usage + 1
-        else:
-            # Non-authenticated user (use IP)
-            ip_key = f"ip:{ip_address}"
-            current_usage = today_data.get(ip_key, 0)
-            limit = self.limits['anonymous']
+        today_key = self._get_today_key()
+        with _usage_lock:
+            today_data = self._load_usage_data().setdefault(today_key, {})
+            current_usage = today_data.get(subject_key, 0)
             
             if current_usage >= limit:
-                return False
+                return False, current_usage, limit
             
-            today_data[ip_key] = current_usage + 1
-        
-        # Save updated data
-        self._save_usage_data(data)
+            today_data[subject_key] = current_usage + 1
+            self._record_increment(today_key, subject_key)
         
         logger.info(f"Usage incremented - User: {user_id or 'anonymous'}, IP: {ip_address}, "
-                   f"New count: {today_data.get(user_key if user_id else ip_key)}")
+                   f"New count: {current_usage + 1}")
         
-        return True
+        return True, current_usage + 1, limit
+    
+    def increment_usage(self, user_id: Optional[str] = None, ip_address: Optional[str] = None) -> bool:
+        """
+        Increment usage count for user/IP
+        
+        Args:
+            user_id: User ID for authenticated users
+            ip_address: IP address for non-authenticated users
+            
+        Returns:
+            True if increment was successful, False if limit would be exceeded
+        """
+        return self.check_and_increment(user_id, ip_address)[0]
     
     def get_usage_stats(self, user_id: Optional[str] = None, ip_address: Optional[str] = None) -> Dict:
         """
@@ -193,20 +330,20 @@ class UsageTracker:
             True if reset was successful
         """
         try:
-            data = self._load_usage_data()
-            today_key = self._get_today_key()
+            if self._redis is not None:
+                self._redis.delete(self._redis_key(self._subject(user_id, ip_address)[0]))
+                logger.info(f"Usage reset - User: {user_id or 'anonymous'}, IP: {ip_address}")
+                return True
             
-            if today_key in data:
-                if user_id:
-                    user_key = f"user:{user_id}"
-                    if user_key in data[today_key]:
-                        del data[today_key][user_key]
-                else:
-                    ip_key = f"ip:{ip_address}"
-                    if ip_key in data[today_key]:
-                        del data[today_key][ip_key]
-                
-                self._save_usage_data(data)
+            today_key = self._get_today_key()
+            subject_key = self._subject(user_id, ip_address)[0]
+            with _usage_lock:
+                self._load_usage_data()
+                pending_day = _usage_pending.get(self.usage_file, {}).get(today_key)
+                if pending_day:
+                    pending_day.pop(subject_key, None)
+                # Admin resets are written through immediately, for every process
+                _sync_usage_file(self.usage_file, reset=(today_key, subject_key))
             
             logger.info(f"Usage reset - User: {user_id or 'anonymous'}, IP: {ip_address}")
             return True
@@ -5,8 +5,15 @@ Test script to verify Together AI API connectivity
 import requests
 import json
 import os
+import sys
 from dotenv import load_dotenv
 
+# Add the backend directory to the path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Same pooled session and adapter settings the app uses for Together AI
+from services.together_ai import together_session
+
 # Load environment variables
 load_dotenv()
 
@@ -40,7 +47,7 @@ def test_together_ai():
     print(f"Payload: {json.dumps(payload, indent=2)}")
     
     try:
-        response = requests.post(
+        response = together_session.post(
             'https://api.together.xyz/v1/images/generations',
             json=payload,
             headers=headers,
@@ -145,7 +145,10 @@ def test_usage_tracker():
         print("\n🎉 All tests passed! Usage tracker is working correctly.")
         
     finally:
-        # Clean up
+        # Clean up; flush first so the background writer doesn't recreate the file
+        tracker.flush()
+        if os.path.exists(temp_file + '.lock'):
+            os.unlink(temp_file + '.lock')
         if os.path.exists(temp_file):
             os.unlink(temp_file)
             print(f"🧹 Cleaned up test file: {temp_file}")
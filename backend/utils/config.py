@@ -1,6 +1,21 @@
 import os
+import logging
 from datetime import timedelta
 
+logger = logging.getLogger(__name__)
+
+def _parse_resolution_sizes(resolutions):
+    """Parse 'WIDTHxHEIGHT' strings into (width, height) pairs, skipping and logging malformed entries"""
+    sizes = set()
+    for resolution in resolutions:
+        try:
+            width, height = map(int, resolution.split('x'))
+        except ValueError:
+            logger.error(f"Ignoring malformed SUPPORTED_RESOLUTIONS entry: {resolution!r}")
+            continue
+        sizes.add((width, height))
+    return frozenset(sizes)
+
 class Config:
     """Application configuration"""
     
@@ -15,6 +30,9 @@ class Config:
     # Rate limiting
     RATELIMIT_STORAGE_URL = os.getenv('REDIS_URL', 'memory://')
     
+    # Daily generation counters; stored in usage_data.json when unset
+    USAGE_REDIS_URL = os.getenv('REDIS_URL')
+    
     # Clerk authentication
     CLERK_SECRET_KEY = os.getenv('CLERK_SECRET_KEY')
     CLERK_PUBLISHABLE_KEY = os.getenv('CLERK_PUBLISHABLE_KEY')
@@ -38,6 +56,7 @@ class Config:
     DYNAMODB_TABLE_USERS = os.getenv('DYNAMODB_TABLE_USERS', 'promptcanvaspro-users')
     DYNAMODB_TABLE_IMAGES = os.getenv('DYNAMODB_TABLE_IMAGES', 'promptcanvaspro-images')
     DYNAMODB_TABLE_GENERATIONS = os.getenv('DYNAMODB_TABLE_GENERATIONS', 'promptcanvaspro-generations')
+    DYNAMODB_IMAGES_USER_INDEX = os.getenv('DYNAMODB_IMAGES_USER_INDEX', 'user-id-created-at-index')
     
     # File upload settings
     MAX_CONTENT_LENGTH = int(os.getenv('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))  # 16MB
@@ -47,7 +66,9 @@ class Config:
     MAX_PROMPT_LENGTH = int(os.getenv('MAX_PROMPT_LENGTH', 500))
     DEFAULT_IMAGE_WIDTH = int(os.getenv('DEFAULT_IMAGE_WIDTH', 1024))
     DEFAULT_IMAGE_HEIGHT = int(os.getenv('DEFAULT_IMAGE_HEIGHT', 1024))
-    SUPPORTED_RESOLUTIONS = os.getenv('SUPPORTED_RESOLUTIONS', '512x512,1024x1024,1024x768,768x1024').split(',')
+    SUPPORTED_RESOLUTIONS = tuple(resolution.strip() for resolution in os.getenv('SUPPORTED_RESOLUTIONS', '512x512,1024x1024,1024x768,768x1024').split(','))
+    # (width, height) pairs for validate_resolution
+    SUPPORTED_RESOLUTION_SIZES = _parse_resolution_sizes(SUPPORTED_RESOLUTIONS)
     MAX_IMAGES_PER_USER = int(os.getenv('MAX_IMAGES_PER_USER', 100))
     MAX_GENERATIONS_PER_DAY = int(os.getenv('MAX_GENERATIONS_PER_DAY', 5))
     
@@ -94,6 +115,7 @@ class TestingConfig(Config):
     TESTING = True
     # Use in-memory storage for testing
     RATELIMIT_STORAGE_URL = 'memory://'
+    USAGE_REDIS_URL = None
 
 class ProductionConfig(Config):
     """Production configuration"""